@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import traceback
+
+import numpy as np
+
+
+TARGET_LOUDNESS: float = -16  # LUFS
+PEAK_CEILING: float = -1  # dBFS
+MAX_GAIN: float = 24  # dB either way
+SILENCE_THRESHOLD: float = -50  # dBFS
+SILENCE_MARGIN: float = 0.005  # seconds kept before the first and after the last loud frame
+
+BLOCK_SECONDS: float = 0.4
+BLOCK_STEP: float = 0.1  # 75% overlap, as in BS.1770
+BLOCK_BATCH: int = 64
+SCAN_FRAMES: int = 65536  # frames widened at a time looking for the peak and the silence
+
+
+def content_hash(buffer) -> str:
+    return hashlib.blake2b(buffer, digest_size=16).hexdigest()
+
+
+def k_weighting(frequencies: np.ndarray) -> np.ndarray:
+    # |H|^2 of the BS.1770 pre-filter (high shelf) times the RLB high-pass, evaluated analytically at 48 kHz
+    # and applied in the frequency domain so nothing has to run sample by sample
+    def response(b, a, w):
+        z = np.exp(-1j * w)
+        return np.abs((b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)) ** 2
+
+    w = 2 * np.pi * np.minimum(frequencies, 24000) / 48000
+    shelf = response((1.53512485958697, -2.69169618940638, 1.19839281085285), (1, -1.69065929318241, 0.73248077421585), w)
+    highpass = response((1, -2, 1), (1, -1.99004745483398, 0.99007225036621), w)
+    return shelf * highpass
+
+
+class Analysis:
+    def __init__(self, loudness: float, peak: float, gain: float, start: int, end: int):
+        self.loudness = loudness  # LUFS, -inf for silence
+        self.peak = peak  # dBFS
+        self.gain = gain  # linear normalisation gain
+        # first and one past the last non silent frame
+        self.start = start
+        self.end = end
+
+    def to_dict(self) -> dict:
+        return {"loudness": self.loudness, "peak": self.peak, "gain": self.gain, "start": self.start, "end": self.end}
+
+    @staticmethod
+    def from_dict(d: dict) -> Analysis:
+        return Analysis(d["loudness"], d["peak"], d["gain"], d["start"], d["end"])
+
+
+def integrated_loudness(data: np.ndarray, rate: int) -> float:
+    step = min(int(BLOCK_STEP * rate), data.shape[0])
+    if step == 0:
+        return float("-inf")
+
+    # mean square of every step long slice, K-weighted through parseval. a gating block is four consecutive
+    # slices, so the overlapping blocks are averaged from these instead of being transformed four times over
+    weights = k_weighting(np.fft.rfftfreq(step, 1 / rate))
+    slices = data[:data.shape[0] // step * step].reshape(-1, step, data.shape[1])
+    slice_powers = np.empty(len(slices))
+
+    for i in range(0, len(slices), BLOCK_BATCH):
+        batch = slices[i:i + BLOCK_BATCH].astype(np.float32) / 32768
+        spectrum = np.abs(np.fft.rfft(batch, axis=1)) ** 2
+        spectrum[:, 1:-1] *= 2  # fold in the negative frequencies
+        slice_powers[i:i + len(batch)] = np.einsum("nfc,f->n", spectrum, weights) / step ** 2
+
+    per_block = max(1, min(len(slice_powers), round(BLOCK_SECONDS / BLOCK_STEP)))
+    powers = np.convolve(slice_powers, np.full(per_block, 1 / per_block), mode="valid")
+
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(powers)
+
+    gated = powers[loudness > -70]
+    if len(gated) == 0:
+        return float("-inf")
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10
+    gated = powers[loudness > max(relative, -70)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def analyse(data: np.ndarray, rate: int) -> Analysis:
+    # peak and silence bounds a slice at a time, so a mapped file is never widened whole into memory
+    threshold = 32768 * 10 ** (SILENCE_THRESHOLD / 20)
+    peak_sample = 0
+    first = last = None
+    for offset in range(0, data.shape[0], SCAN_FRAMES):
+        magnitude = np.abs(data[offset:offset + SCAN_FRAMES].astype(np.int32)).max(axis=1)
+        peak_sample = max(peak_sample, int(magnitude.max()))
+        loud = np.flatnonzero(magnitude > threshold)
+        if len(loud):
+            if first is None:
+                first = offset + int(loud[0])
+            last = offset + int(loud[-1])
+    peak = 20 * np.log10(peak_sample / 32768) if peak_sample else float("-inf")
+
+    if first is None:
+        return Analysis(float("-inf"), peak, 1.0, 0, data.shape[0])
+
+    margin = int(SILENCE_MARGIN * rate)
+    start = max(0, first - margin)
+    end = min(data.shape[0], last + 1 + margin)
+
+    loudness = integrated_loudness(data[start:end], rate)
+    gain_db = 0.0
+    if np.isfinite(loudness):
+        gain_db = min(TARGET_LOUDNESS - loudness, PEAK_CEILING - peak, MAX_GAIN)
+        gain_db = max(gain_db, -MAX_GAIN)
+
+    return Analysis(loudness, float(peak), float(10 ** (gain_db / 20)), start, end)
+
+
+class AnalysisCache:
+    # analysis results keyed by content hash, so renaming or copying a file never recomputes it
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty: bool = False
+
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            traceback.print_exc()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(digest: str, rate: int, channels: int) -> str:
+        # frame offsets depend on the internal format the sample was converted to
+        return f"{digest}:{rate}:{channels}"
+
+    def get(self, key: str) -> Analysis | None:
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else Analysis.from_dict(entry)
+
+    def put(self, key: str, analysis: Analysis) -> None:
+        with self._lock:
+            self._entries[key] = analysis.to_dict()
+            self._dirty = True
+
+    def analyse(self, digest: str, data: np.ndarray, rate: int) -> Analysis:
+        key = self.key(digest, rate, data.shape[1])
+        analysis = self.get(key)
+        if analysis is None:
+            analysis = analyse(data, rate)
+            self.put(key, analysis)
+        return analysis
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            serialised = json.dumps(self._entries)
+            self._dirty = False
+
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            f.write(serialised)
+        os.replace(temp, self.path)
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import List, Mapping
+
+import numpy as np
+
+from ring import PCMRing
+
+
+DeviceParameters = Mapping[str, str | int | float]
+
+# pyaudio.paInputOverflowed / pyaudio.paOutputUnderflowed, duplicated so the fake backend doesn't need pyaudio.
+# pyaudio raises them as IOError(text, code)
+INPUT_OVERFLOWED: int = -9981
+OUTPUT_UNDERFLOWED: int = -9980
+# pyaudio.paInputOverflow, the status flag a stream callback gets when the device dropped input
+INPUT_OVERFLOW_FLAG: int = 0x2
+PA_CONTINUE: int = 0
+
+
+class PyAudioBackend:
+    # pyaudio isn't imported, nor portaudio initialised (which scans every host api), until a device is first
+    # needed, so that happens on whichever background thread gets there first rather than before the window shows
+
+    def __init__(self, rate: int, channels: int, chunk: int):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.format: int = 8  # pyaudio.paInt16
+        self._audio = None
+        self._lock = threading.Lock()
+
+    @property
+    def audio(self):
+        if self._audio is None:
+            with self._lock:
+                if self._audio is None:
+                    import pyaudio
+                    self._audio = pyaudio.PyAudio()
+        return self._audio
+
+    def devices(self) -> List[DeviceParameters]:
+        api_info = self.audio.get_host_api_info_by_index(0)
+        return [self.audio.get_device_info_by_index(i) for i in range(api_info["deviceCount"])]
+
+    def open(self, *args, chunk: int | None = None, **kwargs):
+        return self.audio.open(format=self.format,
+                               channels=self.channels,
+                               rate=self.rate,
+                               frames_per_buffer=chunk or self.chunk,
+                               *args,
+                               **kwargs)
+
+    def open_input(self, device_index: int, chunk: int | None = None):
+        return CallbackInputStream(self, device_index, chunk or self.chunk)
+
+    def open_output(self, device_index: int, chunk: int | None = None):
+        return self.open(output=True, output_device_index=device_index, chunk=chunk)
+
+    def terminate(self) -> None:
+        if self._audio is not None:
+            self._audio.terminate()
+
+
+class CallbackInputStream:
+    # input in callback mode behind the blocking read the engine uses. a blocking read can only report an overflow
+    # by raising, and pyaudio throws the chunk it read away when it does. the callback gets it as a status flag
+    # and keeps the audio
+    BUFFERS: int = 4
+
+    def __init__(self, backend: PyAudioBackend, device_index: int, chunk: int):
+        self.channels = backend.channels
+        self.ring = PCMRing(chunk * self.BUFFERS, self.channels)
+        # overflows so far, counted on portaudio's thread
+        self.overflows: int = 0
+        self.closed: bool = False
+        self._ready = threading.Condition()
+        self.stream = backend.open(input=True, input_device_index=device_index, chunk=chunk,
+                                   stream_callback=self.callback)
+
+    def callback(self, data: bytes, frame_count: int, time_info, status: int):
+        if status & INPUT_OVERFLOW_FLAG:
+            self.overflows += 1
+        pcm = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        if self.ring.write(pcm) < len(pcm):
+            self.overflows += 1  # the reader is a whole ring behind, the newest frames had nowhere to go
+        with self._ready:
+            self._ready.notify()
+        return None, PA_CONTINUE
+
+    def read(self, num_frames: int, exception_on_overflow: bool = False) -> bytes:
+        with self._ready:
+            self._ready.wait_for(lambda: len(self.ring) >= num_frames or self.closed, timeout=1)
+        out = np.zeros((num_frames, self.channels), dtype=np.int16)
+        self.ring.read_into(out, num_frames)
+        return out.tobytes()
+
+    def stop_stream(self) -> None:
+        self.stream.stop_stream()
+
+    def close(self) -> None:
+        self.stream.close()
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class FakeInputStream:
+    def __init__(self, rate: int, channels: int, buffer_frames: int, realtime: bool = True,
+                 signal: np.ndarray | None = None):
+        self.rate = rate
+        self.channels = channels
+        self.buffer_frames = buffer_frames
+        self.realtime = realtime
+        # (frames, channels) int16 looped forever, silence if None
+        self.signal = signal
+
+        self.position: int = 0
+        self.overflows: int = 0
+        self.closed: bool = False
+        self._start: float | None = None
+
+    def clock(self) -> int:
+        return int((time.perf_counter() - self._start) * self.rate)
+
+    def read(self, num_frames: int, exception_on_overflow: bool = True) -> bytes:
+        overflowed = False
+
+        if self.realtime:
+            if self._start is None:
+                self._start = time.perf_counter()
+
+            if self.clock() - self.position > self.buffer_frames:
+                # nobody read for too long, the device threw the oldest frames away
+                self.position = self.clock() - num_frames
+                self.overflows += 1
+                overflowed = True
+
+            ahead = self.position + num_frames - self.clock()
+            if ahead > 0:
+                time.sleep(ahead / self.rate)
+
+        if self.signal is None:
+            data = np.zeros(num_frames * self.channels, dtype=np.int16)
+        else:
+            indices = np.arange(self.position, self.position + num_frames) % len(self.signal)
+            data = self.signal[indices].reshape(-1)
+        self.position += num_frames
+
+        if overflowed and exception_on_overflow:
+            raise IOError("Input overflowed", INPUT_OVERFLOWED)
+        return data.tobytes()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeOutputStream:
+    def __init__(self, rate: int, channels: int, buffer_frames: int, realtime: bool = True, capture: bool = False):
+        self.rate = rate
+        self.channels = channels
+        self.buffer_frames = buffer_frames
+        self.realtime = realtime
+
+        self.written: int = 0
+        self.underruns: int = 0
+        self.captured: List[bytes] | None = [] if capture else None
+        self.closed: bool = False
+        self._start: float | None = None
+
+    def clock(self) -> int:
+        return int((time.perf_counter() - self._start) * self.rate)
+
+    def write(self, frames, num_frames: int | None = None, exception_on_underflow: bool = False) -> None:
+        if num_frames is None:
+            num_frames = len(frames) // (self.channels * 2)
+
+        underflowed = False
+
+        if self.realtime:
+            if self._start is None:
+                # portaudio starts an output stream with part of its buffer already queued
+                self._start = time.perf_counter()
+                self.written = self.buffer_frames // 2
+
+            played = self.clock()
+            if self.written < played:
+                self.underruns += 1
+                underflowed = True
+                self.written = played
+
+            over = self.written + num_frames - played - self.buffer_frames
+            if over > 0:
+                # device buffer is full, block like portaudio does
+                time.sleep(over / self.rate)
+
+        self.written += num_frames
+        if self.captured is not None:
+            self.captured.append(bytes(frames))
+
+        if underflowed and exception_on_underflow:
+            raise IOError("Output underflowed", OUTPUT_UNDERFLOWED)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeBackend:
+    BUFFERS: int = 4
+
+    def __init__(self, rate: int, channels: int, chunk: int, realtime: bool = True,
+                 signal: np.ndarray | None = None, capture: bool = False):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.realtime = realtime
+        self.signal = signal
+        self.capture = capture
+
+        self.inputs: List[FakeInputStream] = []
+        self.outputs: List[FakeOutputStream] = []
+
+    def devices(self) -> List[DeviceParameters]:
+        return [
+            {"index": 0, "name": "Fake Microphone", "maxInputChannels": self.channels, "maxOutputChannels": 0},
+            {"index": 1, "name": "Fake Cable", "maxInputChannels": 0, "maxOutputChannels": self.channels},
+            {"index": 2, "name": "Fake Headphones", "maxInputChannels": 0, "maxOutputChannels": self.channels},
+        ]
+
+    def open_input(self, device_index: int, chunk: int | None = None) -> FakeInputStream:
+        stream = FakeInputStream(self.rate, self.channels, (chunk or self.chunk) * self.BUFFERS, self.realtime,
+                                 self.signal)
+        self.inputs.append(stream)
+        return stream
+
+    def open_output(self, device_index: int, chunk: int | None = None) -> FakeOutputStream:
+        stream = FakeOutputStream(self.rate, self.channels, (chunk or self.chunk) * self.BUFFERS, self.realtime,
+                                  self.capture)
+        self.outputs.append(stream)
+        return stream
+
+    def terminate(self) -> None:
+        pass
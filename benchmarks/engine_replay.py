@@ -0,0 +1,121 @@
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from backends import FakeBackend
+from board import AppInfo, SoundSpec, Soundboard
+from samples import Sample
+
+
+CHUNK: int = 512
+CHANNELS: int = 2
+RATE: int = 44100
+
+Script = List[Tuple[float, str]]
+
+
+def make_board(backend: FakeBackend, sounds: int, seconds: float) -> Soundboard:
+    appinfo = AppInfo()
+    appinfo.max_voices = 64
+    # every sound shares one array, so the budget is only bookkeeping here
+    appinfo.sample_cache_mb = 1 << 16
+    board = Soundboard(backend, appinfo, CHUNK, CHANNELS, RATE)
+
+    rng = np.random.default_rng(0)
+    data = rng.integers(-4000, 4000, (int(RATE * seconds), CHANNELS), dtype=np.int16)
+    for i in range(sounds):
+        spec = SoundSpec()
+        spec.name = f"bench {i}"
+        spec.path = f"<bench {i}>"
+        spec.keys = {f"k{i}"}
+        appinfo.sounds.append(spec)
+        board.hotkeys.add(spec)
+        # straight into the cache, nothing on disk
+        board.sample_cache.put(spec.path, 0, Sample(data, RATE, spec.path))
+
+    board.open(0, 1, 2)
+    return board
+
+
+def make_script(sounds: int, duration: float, rate: float) -> Script:
+    rng = np.random.default_rng(1)
+    times = np.sort(rng.uniform(0, duration, int(duration * rate)))
+    keys = rng.integers(0, sounds, len(times))
+    return [(float(t), f"k{k}") for t, k in zip(times, keys)]
+
+
+def replay(board: Soundboard, script: Script) -> None:
+    start = time.perf_counter()
+    for at, key in script:
+        delay = at - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+        board.on_pressed(key)
+        board.on_released(key)
+
+
+def run_realtime(args) -> None:
+    board = make_board(FakeBackend(RATE, CHANNELS, CHUNK, realtime=True), args.sounds, args.sound_seconds)
+    script = make_script(args.sounds, args.duration, args.rate)
+
+    cpu = time.process_time()
+    board.start()
+    replay(board, script)
+    time.sleep(args.sound_seconds)
+    cpu = time.process_time() - cpu
+    stats = board.get_stats()
+    board.close()
+
+    chunk = stats["chunk_ms"]
+    latency = stats["latency_ms"]
+    print(f"realtime: {len(script)} triggers over {args.duration:g}s, {stats['chunks']} chunks")
+    print(f"  cpu per chunk   {cpu / max(1, stats['chunks']) * 1e3:.3f}ms (whole process)")
+    print(f"  mix per chunk   mean {chunk['mean']:.3f}ms  p99 {chunk['p99']:.3f}ms  max {chunk['max']:.3f}ms"
+          f"  / {stats['period_ms']:.2f}ms")
+    print(f"  latency         p50 {latency['p50']:.2f}ms  p95 {latency['p95']:.2f}ms  p99 {latency['p99']:.2f}ms"
+          f"  max {latency['max']:.2f}ms")
+    print(f"  xruns           {stats['input_overflows']} overflows  {stats['output_underruns']} underruns")
+
+
+def run_throughput(args) -> None:
+    chunks = args.chunks
+    board = make_board(FakeBackend(RATE, CHANNELS, CHUNK, realtime=False), args.sounds, chunks * CHUNK / RATE)
+    # keep every voice busy for the whole run
+    for i in range(min(args.sounds, board.appinfo.max_voices)):
+        board.on_pressed(f"k{i}")
+        board.on_released(f"k{i}")
+    board.engine.process_commands()
+    voices = len(board.engine.mixer.voices)
+
+    # drive the engine directly so nothing but the audio path is measured
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for _ in range(chunks):
+        board.engine.process_chunk()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    board.close()
+
+    audio_seconds = chunks * CHUNK / RATE
+    print(f"throughput: {voices} voices, {chunks} chunks in {elapsed:.2f}s")
+    print(f"  {chunks / elapsed:.0f} chunks/s, {audio_seconds / elapsed:.1f}x realtime")
+    print(f"  cpu per chunk   {cpu / chunks * 1e3:.3f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay scripted hotkeys against a headless engine.")
+    parser.add_argument("--sounds", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5, help="seconds of script to replay")
+    parser.add_argument("--rate", type=float, default=8, help="triggers per second")
+    parser.add_argument("--sound-seconds", type=float, default=1)
+    parser.add_argument("--chunks", type=int, default=5000, help="chunks to mix in the throughput run")
+    args = parser.parse_args()
+
+    run_throughput(args)
+    run_realtime(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from dsp import COMPRESSOR, GATE, HIGHPASS, LIMITER, EffectChain
+
+
+CHANNELS: int = 2
+RATE: int = 44100
+ITERATIONS: int = 2000
+CHUNK_SIZES = (128, 256, 512, 1024, 2048)
+STAGES = (HIGHPASS, GATE, COMPRESSOR, LIMITER)
+BUDGET: float = 0.1  # of the chunk period
+
+
+def time_it(f) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        f()
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+
+    print(f"{'chunk':>6} " + " ".join(f"{stage:>11}" for stage in STAGES) + f" {'chain':>11} {'period':>8}")
+    for chunk in CHUNK_SIZES:
+        # speech level noise with the odd loud burst so the gate and dynamics actually do something
+        mic = rng.normal(0, 3000, (chunk, CHANNELS)).astype(np.float32)
+        mic[::97] *= 8
+        block = np.empty_like(mic)
+
+        def run(chain):
+            # include the copy the mixer does into its block row
+            np.copyto(block, mic)
+            chain.process(block)
+
+        results = []
+        for stage in STAGES:
+            single = EffectChain(RATE, CHANNELS, {stage: True})
+            results.append(time_it(lambda: run(single)))
+        chain = EffectChain(RATE, CHANNELS, dict.fromkeys(STAGES, True))
+        total = time_it(lambda: run(chain))
+
+        period = chunk / RATE
+        verdict = "ok" if total < BUDGET * period else "OVER BUDGET"
+        print(f"{chunk:>6} " + " ".join(f"{result * 1e6:>9.1f}us" for result in results)
+              + f" {total * 1e6:>9.1f}us {total / period:>7.1%}  {verdict}")
+
+
+if __name__ == '__main__':
+    main()
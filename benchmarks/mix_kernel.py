@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+
+from mixer import LIMIT_CLIP, LIMIT_SOFT, MixKernel
+
+
+CHANNELS: int = 2
+RATE: int = 44100
+ITERATIONS: int = 2000
+CHUNK_SIZES = (64, 128, 256, 512, 1024, 2048, 4096)
+
+
+def legacy_mix(a: bytes, b: bytes, volume_a: float = 1, volume_b: float = 1) -> bytes:
+    # the original two-buffer mix() this kernel replaces
+    return ((np.frombuffer(a, dtype=np.int16) * volume_a + np.frombuffer(b, dtype=np.int16) * volume_b) // 2).astype(np.int16).tobytes()
+
+
+def time_it(f) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        f()
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+
+    print(f"{'chunk':>6} {'legacy':>10} {'clip':>10} {'soft':>10}")
+    for chunk in CHUNK_SIZES:
+        samples = chunk * CHANNELS
+        mic = rng.integers(-20000, 20000, samples, dtype=np.int16)
+        sound = rng.integers(-20000, 20000, samples, dtype=np.int16)
+        mic_bytes = mic.tobytes()
+        sound_bytes = sound.tobytes()
+
+        legacy = time_it(lambda: legacy_mix(mic_bytes, sound_bytes, volume_b=0.5))
+
+        results = []
+        for limiter in (LIMIT_CLIP, LIMIT_SOFT):
+            kernel = MixKernel(2, samples, limiter)
+            kernel.gains[:2] = (1, 0.5)
+
+            def run():
+                # include the int16 -> float gather the mixer does every chunk
+                kernel.block[0] = mic
+                kernel.block[1] = sound
+                kernel.run(2)
+
+            results.append(time_it(run))
+
+        print(f"{chunk:>6} {legacy * 1e6:>8.1f}us {results[0] * 1e6:>8.1f}us {results[1] * 1e6:>8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
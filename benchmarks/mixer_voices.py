@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from mixer import Mixer, Voice
+from samples import Sample
+
+
+CHUNK: int = 512
+CHANNELS: int = 2
+RATE: int = 44100
+ITERATIONS: int = 500
+VOICE_COUNTS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class BenchSpec:
+    volume: float = 0.5
+
+
+def make_sample(frames: int) -> Sample:
+    rng = np.random.default_rng(0)
+    return Sample(rng.integers(-8000, 8000, (frames, CHANNELS), dtype=np.int16), RATE)
+
+
+def bench(voice_count: int, clip: Sample) -> float:
+    mixer = Mixer(CHUNK, CHANNELS, max_voices=max(1, voice_count))
+    for _ in range(voice_count):
+        mixer.add(Voice(BenchSpec(), clip))
+    mic = np.zeros(CHUNK * CHANNELS, dtype=np.int16)
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        mixer.mix(mic)
+    elapsed = time.perf_counter() - start
+
+    mixer.clear()
+    return elapsed / ITERATIONS
+
+
+def main() -> None:
+    clip = make_sample(CHUNK * (ITERATIONS + 1))
+    period = CHUNK / RATE
+
+    print(f"chunk={CHUNK} channels={CHANNELS} period={period * 1e3:.2f}ms")
+    print(f"{'voices':>6} {'per chunk':>12} {'% period':>9}")
+    for voice_count in VOICE_COUNTS:
+        cost = bench(voice_count, clip)
+        print(f"{voice_count:>6} {cost * 1e6:>10.1f}us {cost / period * 100:>8.2f}%")
+
+
+if __name__ == '__main__':
+    main()
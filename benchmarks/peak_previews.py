@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+import peaks
+from peaks import PeakCache
+from samples import load_sample
+
+
+CHANNELS: int = 2
+RATE: int = 44100
+SOUNDS: int = 1000
+SECONDS: float = 0.25
+WIDTH: int = 128  # a thumbnail's waveform
+HEIGHT: int = 16
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = []
+        for i in range(SOUNDS):
+            path = os.path.join(root, f"{i}.wav")
+            with wave.open(path, "wb") as f:
+                f.setnchannels(CHANNELS)
+                f.setsampwidth(2)
+                f.setframerate(RATE)
+                f.writeframes(rng.normal(0, 3000, (int(SECONDS * RATE), CHANNELS)).astype("<i2").tobytes())
+            paths.append(path)
+
+        directory = os.path.join(root, "peaks")
+        cache = PeakCache(directory, RATE, CHANNELS)
+        start = time.perf_counter()
+        for path in paths:
+            sample = load_sample(path, RATE, CHANNELS)
+            cache.put(path, os.stat(path).st_mtime, sample.digest, sample.data)
+        built = time.perf_counter() - start
+        cache.close()
+
+        # a fresh start: everything has to come off disk, and reading any audio is a failure
+        def refuse(*args, **kwargs):
+            raise AssertionError("read audio for a preview")
+
+        peaks.load_file = refuse
+        cache = PeakCache(directory, RATE, CHANNELS)
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            for path in paths:
+                cache.get(path).outline(WIDTH, HEIGHT)
+            timings.append(time.perf_counter() - start)
+        cache.close()
+
+    print(f"decode + build {SOUNDS} sounds: {built * 1e3:8.1f}ms")
+    print(f"draw {SOUNDS} thumbnails cold: {timings[0] * 1e3:8.1f}ms ({timings[0] / SOUNDS * 1e6:.0f}us each)")
+    print(f"draw {SOUNDS} thumbnails warm: {timings[1] * 1e3:8.1f}ms ({timings[1] / SOUNDS * 1e6:.0f}us each)")
+
+
+if __name__ == '__main__':
+    main()
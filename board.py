@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Hashable, List
+
+from analysis import AnalysisCache, analyse, content_hash
+from convert import QUALITY_FAST
+from decoders import COMPRESSED_EXTENSIONS, WAVE_EXTENSIONS, DecoderPool
+from devices import DeviceManager
+from dsp import COMPRESSOR, GATE, HIGHPASS, LIMITER
+from engine import AudioEngine
+from hotkeys import HotkeyIndex
+from mixer import LIMIT_SOFT, Voice
+from peaks import PeakCache
+from replay import REPLAY_DIRECTORY, ReplayBuffer, replay_path, wav_bytes
+from samples import Sample, SampleCache
+from scheduler import FOREVER, ScheduledEvent, start, stop
+from search import SearchIndex
+from tuning import ChunkTuner, device_key
+
+if TYPE_CHECKING:
+    from pynput import keyboard
+
+    from importer import BulkImport, ImportResult
+
+
+class SoundSpec:
+    def __init__(self):
+        self.id: str = uuid.uuid4().hex
+        self.name: str = "Sound"
+        self.path: str = ""
+        self.volume: float = 1
+        self.keys: set[keyboard.Key] = set()
+        # passes to play, FOREVER repeats until triggered again
+        self.loops: int = 1
+        # overlap between passes, and the fade out when a forever loop is stopped
+        self.crossfade_ms: int = 0
+        self.delay_ms: int = 0
+        # [spec id, ms after this one starts] for other sounds triggered along with it
+        self.sequence: List[list] = []
+
+    @property
+    def scheduled(self) -> bool:
+        return self.loops != 1 or self.delay_ms > 0 or bool(self.sequence)
+
+    def __setstate__(self, state):
+        # fill in anything added since the pickle was written
+        self.__init__()
+        self.__dict__.update(state)
+
+
+class AppInfo:
+    VERSION: float = 0.2
+
+    def __init__(self):
+        self.version: float = self.VERSION
+        self.sounds: List[SoundSpec] = []
+        self.echo: bool = True
+        self.echo_latency_ms: int = 60
+        self.input_device_name = ""
+        self.output_device_name = ""
+        self.echo_device_name = ""
+        self.max_voices: int = 16
+        self.sample_cache_mb: int = 256
+        self.limiter: str = LIMIT_SOFT
+        self.resample_quality: str = QUALITY_FAST
+        self.show_stats: bool = False
+        # "" disables the periodic dump, .csv dumps csv and anything else dumps json lines
+        self.stats_path: str = ""
+        self.stats_interval: float = 10
+        self.normalize: bool = True
+        self.trim_silence: bool = True
+        # grow and shrink the period at runtime from measured xruns and mixing headroom
+        self.adaptive_chunk: bool = False
+        self.min_chunk: int = 128
+        self.max_chunk: int = 2048
+        # mic effects chain, stage name -> on
+        self.mic_effects: dict[str, bool] = {HIGHPASS: False, GATE: False, COMPRESSOR: False, LIMITER: False}
+        # seconds of cable output kept for instant replay, and whether a saved replay lands on the board
+        self.replay_seconds: int = 60
+        self.replay_to_board: bool = True
+        # "input|output" device names -> the period last settled on for that pair
+        self.tuned_chunks: dict[str, int] = {}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    def dumps(self) -> bytes:
+        return pickle.dumps(self)
+
+    @staticmethod
+    def loads(serialised: bytes) -> AppInfo:
+        return pickle.loads(serialised)
+
+
+MAX_SEQUENCE_DEPTH: int = 4  # sequences can name each other, this stops a cycle going round forever
+
+
+class Soundboard:
+    # everything the gui drives, minus the gui, so it can run headless against any backend
+
+    def __init__(self, backend, appinfo: AppInfo, chunk: int, channels: int, rate: int,
+                 analysis_path: str | None = None, device_cache_path: str | None = None,
+                 replay_directory: str = REPLAY_DIRECTORY, peak_directory: str | None = None):
+        self.backend = backend
+        self.appinfo = appinfo
+        self.chunk = chunk
+        self.channels = channels
+        self.rate = rate
+
+        self.devices = DeviceManager(backend, device_cache_path)
+
+        self.hotkeys = HotkeyIndex(appinfo.sounds)
+        self.search = SearchIndex(appinfo.sounds)
+        self.global_keys: set[Hashable] = set()
+
+        self.analyses = AnalysisCache(analysis_path) if analysis_path is not None else None
+        self.decoders = DecoderPool(rate, channels)
+        # waveform previews, on disk so the grid can draw them at startup without touching the audio
+        self.peaks = PeakCache(peak_directory, rate, channels, appinfo.resample_quality, self.decoders.ffmpeg)
+        self.sample_cache = SampleCache(appinfo.sample_cache_mb * 1024 * 1024, rate=rate, channels=channels,
+                                        quality=appinfo.resample_quality, analyses=self.analyses,
+                                        decoders=self.decoders, peaks=self.peaks)
+
+        self.engine: AudioEngine | None = None
+
+        self.replay = ReplayBuffer(appinfo.replay_seconds, rate, channels)
+        self.replay_directory = replay_directory
+        # one at a time, so saves land in the order they were asked for
+        self._replay_executor = ThreadPoolExecutor(1, thread_name_prefix="Replay")
+
+        # forever loops started and not stopped yet, triggering one of these again stops it
+        self.looping: set[SoundSpec] = set()
+
+        self.tuner = ChunkTuner(self.devices, appinfo.min_chunk, appinfo.max_chunk)
+        self.tuner.tuned.add(self.on_tuned)
+
+    @property
+    def device_key(self) -> str:
+        return device_key(self.appinfo.input_device_name, self.appinfo.output_device_name)
+
+    def start_chunk(self) -> int:
+        # start from wherever tuning got to last time on these devices
+        if not self.appinfo.adaptive_chunk:
+            return self.chunk
+        return self.appinfo.tuned_chunks.get(self.device_key, self.chunk)
+
+    def preload(self) -> None:
+        self.sample_cache.preload_async(spec.path for spec in self.appinfo.sounds)
+
+    def import_folder(self, root: str) -> BulkImport:
+        # pulls in multiprocessing, which nothing else needs, so not at startup
+        from importer import BulkImport, find_audio_files
+
+        known = {spec.path for spec in self.appinfo.sounds}
+        extensions = WAVE_EXTENSIONS + COMPRESSED_EXTENSIONS if self.decoders.ffmpeg else WAVE_EXTENSIONS
+        paths = [path for path in find_audio_files(root, extensions) if path not in known]
+        bulk = BulkImport(paths, self.rate, self.channels, self.appinfo.resample_quality)
+        bulk.start()
+        return bulk
+
+    def add_imported(self, results: List[ImportResult]) -> List[SoundSpec]:
+        specs = []
+        for result in results:
+            if not result.ok:
+                continue
+
+            spec = SoundSpec()
+            spec.name = result.name
+            spec.path = result.path
+
+            # already decoded and analysed by the workers, so the first trigger is a cache hit
+            if result.data is not None:
+                sample = Sample(result.data, self.rate, result.path, result.digest)
+                sample.analysis = result.analysis
+                self.sample_cache.put(result.path, result.mtime, sample)
+                self.peaks.put_async(result.path, result.mtime, result.digest, result.data)
+            if self.analyses is not None:
+                self.analyses.put(AnalysisCache.key(result.digest, self.rate, self.channels), result.analysis)
+
+            self.appinfo.sounds.append(spec)
+            self.hotkeys.add(spec)
+            self.search.add(spec)
+            specs.append(spec)
+        return specs
+
+    def open(self, input_device_index: int, output_device_index: int, echo_device_index: int) -> AudioEngine:
+        chunk = self.start_chunk()
+        input_stream, output_stream, echo_stream = self.devices.open_streams(
+            input_device_index, output_device_index, echo_device_index, chunk,
+        )
+        self.engine = AudioEngine(
+            chunk,
+            self.channels,
+            input_stream,
+            output_stream,
+            echo_stream,
+            echo=self.appinfo.echo,
+            echo_latency=self.appinfo.echo_latency_ms / 1000,
+            max_voices=self.appinfo.max_voices,
+            limiter=self.appinfo.limiter,
+            rate=self.rate,
+            effects=self.appinfo.mic_effects,
+        )
+        self.engine.replay = self.replay
+        return self.engine
+
+    def open_async(self, input_device_index: int, output_device_index: int, echo_device_index: int) -> Future:
+        # opening streams can take a good while on some hosts, so the gui shows first and polls for this
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.open(input_device_index, output_device_index, echo_device_index))
+            except BaseException as error:
+                future.set_exception(error)
+
+        threading.Thread(target=run, name="OpenAudio", daemon=True).start()
+        return future
+
+    def start(self) -> None:
+        self.engine.start()
+        if self.appinfo.adaptive_chunk:
+            self.tuner.start(self.engine)
+
+    def set_adaptive(self, adaptive: bool) -> None:
+        self.appinfo.adaptive_chunk = adaptive
+        if adaptive:
+            self.tuner.start(self.engine)
+        else:
+            self.tuner.stop()
+
+    def set_effect(self, name: str, enabled: bool) -> None:
+        self.appinfo.mic_effects = {**self.appinfo.mic_effects, name: enabled}
+        self.engine.set_effect(name, enabled)
+
+    def set_replay_seconds(self, seconds: int) -> bool:
+        # a fresh buffer, what the old one held is dropped. only swapped here once the engine has it too, so saving
+        # never snapshots a buffer the audio thread isn't writing to
+        replay = ReplayBuffer(seconds, self.rate, self.channels)
+        if self.engine is not None and not self.engine.send(setattr, self.engine, "replay", replay):
+            return False
+        self.appinfo.replay_seconds = seconds
+        self.replay = replay
+        return True
+
+    def save_replay(self, seconds: float | None = None) -> Future:
+        # the copy happens here, the disk and the analysis on the replay thread. resolves to an ImportResult so it
+        # can go through add_imported like anything else
+        return self._replay_executor.submit(self.write_replay, self.replay.snapshot(seconds))
+
+    def write_replay(self, data) -> ImportResult:
+        from importer import ImportResult
+
+        buffer = wav_bytes(data, self.rate)
+        os.makedirs(self.replay_directory, exist_ok=True)
+        path = replay_path(self.replay_directory)
+        with open(path, "wb") as f:
+            f.write(buffer)
+        # hashed the same way loading the file back would
+        return ImportResult(path, os.stat(path).st_mtime, content_hash(buffer), len(data), self.rate,
+                            analyse(data, self.rate), data)
+
+    def on_tuned(self, sender, chunk: int) -> None:
+        # swapped rather than mutated, the settings writer may be serialising the old one
+        self.appinfo.tuned_chunks = {**self.appinfo.tuned_chunks, self.device_key: chunk}
+
+    def close(self) -> None:
+        self.tuner.stop()
+        if self.engine is not None:
+            self.engine.close()
+        self.decoders.close()
+        self._replay_executor.shutdown()
+        self.peaks.close()
+        self.devices.close()
+        self.backend.terminate()
+        if self.analyses is not None:
+            self.analyses.save()
+
+    def on_pressed(self, key: Hashable, timestamp: int | None = None) -> List[SoundSpec]:
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+
+        if key not in self.global_keys:
+            self.global_keys.add(key)
+
+        sounds = self.hotkeys.match(key, self.global_keys)
+        for sound in sounds:
+            self.play_sound(sound, timestamp)
+        return sounds
+
+    def on_released(self, key: Hashable) -> None:
+        if key in self.global_keys:
+            self.global_keys.remove(key)
+
+    def play_sound(self, spec: SoundSpec, timestamp: int | None = None) -> None:
+        if self.engine is None:
+            return  # still opening the devices
+        if spec.scheduled:
+            self.schedule_sound(spec, timestamp)
+            return
+        voice = self.make_voice(spec)
+        if voice is not None:
+            self.engine.play_voice(voice, timestamp)
+
+    def schedule_sound(self, spec: SoundSpec, timestamp: int | None = None) -> None:
+        if spec in self.looping:
+            self.looping.discard(spec)
+            self.engine.schedule([stop(0, spec, self.frames(spec.crossfade_ms))], timestamp)
+            return
+        # marked only once it is on its way, a file that fails to load mustn't need a "stop" press before a retry
+        if self.engine.schedule(self.compile(spec), timestamp) and spec.loops == FOREVER:
+            self.looping.add(spec)
+
+    def frames(self, ms: float) -> int:
+        return round(ms * self.rate / 1000)
+
+    def compile(self, spec: SoundSpec, at: int = 0, depth: int = 0) -> List[ScheduledEvent]:
+        # the spec and everything its sequence pulls in, as events in frames from the trigger
+        at += self.frames(spec.delay_ms)
+        events = []
+        voice = self.make_voice(spec)
+        if voice is not None:
+            events.append(start(at, voice, spec.loops, self.frames(spec.crossfade_ms)))
+
+        if spec.sequence and depth < MAX_SEQUENCE_DEPTH:
+            specs = {sound.id: sound for sound in self.appinfo.sounds}
+            for spec_id, ms in spec.sequence:
+                step = specs.get(spec_id)
+                if step is not None:
+                    events += self.compile(step, at + self.frames(ms), depth + 1)
+        return events
+
+    def make_voice(self, spec: SoundSpec) -> Voice | None:
+        if not spec.path:
+            return None  # just a sequence
+
+        sample = self.sample_cache.get(spec.path)
+        if sample is None:
+            sample = self.sample_cache.load(spec.path)
+
+        if sample.streaming:
+            return Voice(spec, sample, stream=sample.open_stream())
+
+        # one that has never been analysed yet just plays as is
+        analysis = sample.analysis
+        if analysis is None:
+            return Voice(spec, sample)
+
+        start, end = (analysis.start, analysis.end) if self.appinfo.trim_silence else (0, None)
+        normalization = analysis.gain if self.appinfo.normalize else 1
+        return Voice(spec, sample, start=start, end=end, normalization=normalization)
+
+    def stop_sound(self, spec: SoundSpec) -> None:
+        # its forever loop too, nothing could toggle that off once the spec is deleted
+        self.looping.discard(spec)
+        if self.engine is not None:
+            self.engine.stop_sound(spec)
+
+    def stop_all(self) -> None:
+        self.looping.clear()
+        if self.engine is not None:
+            self.engine.stop_sound()
+
+    def playheads(self) -> dict[SoundSpec, List[int]]:
+        # gui thread. frames into the file of every voice that's playing, read without asking the audio thread, so
+        # at worst a chunk stale
+        playheads: dict[SoundSpec, List[int]] = {}
+        if self.engine is not None:
+            for voice in list(self.engine.mixer.voices):
+                if voice.started and not voice.finished:
+                    playheads.setdefault(voice.spec, []).append(voice.position)
+        return playheads
+
+    def get_stats(self) -> dict:
+        stats = self.engine.stats.snapshot()
+        stats["voices"] = len(self.engine.mixer.voices)
+        stats["sample_cache"] = {
+            "hits": self.sample_cache.hits,
+            "misses": self.sample_cache.misses,
+            "bytes": self.sample_cache.size,
+            "entries": len(self.sample_cache),
+        }
+        stats["decoder"] = {
+            "streams": self.decoders.active,
+            "underruns": self.decoders.underruns,
+        }
+        return stats
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from wavmap import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WaveFormatError, WaveHeader
+
+
+QUALITY_FAST: str = "fast"
+QUALITY_BEST: str = "best"
+
+SINC_TAPS: int = 32
+SINC_BLOCK: int = 16384
+SINC_MAX_PHASES: int = 4096
+
+
+def decode_pcm(buffer, header: WaveHeader) -> np.ndarray:
+    count = header.frames * header.channels
+    offset = header.data_offset
+    width = header.sample_width
+
+    if header.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if width == 4:
+            data = np.frombuffer(buffer, dtype="<f4", count=count, offset=offset)
+        elif width == 8:
+            data = np.frombuffer(buffer, dtype="<f8", count=count, offset=offset).astype(np.float32)
+        else:
+            raise WaveFormatError(f"Unsupported float width {width}.")
+    elif header.format_tag == WAVE_FORMAT_PCM:
+        if width == 1:
+            # 8-bit wav is unsigned
+            data = (np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset).astype(np.float32) - 128) / 128
+        elif width == 2:
+            data = np.frombuffer(buffer, dtype="<i2", count=count, offset=offset).astype(np.float32) / 32768
+        elif width == 3:
+            packed = np.frombuffer(buffer, dtype=np.uint8, count=count * 3, offset=offset).reshape(-1, 3)
+            # drop the three bytes into the top of an int32 so the sign comes for free
+            widened = np.zeros((count, 4), dtype=np.uint8)
+            widened[:, 1:] = packed
+            data = widened.view("<i4").reshape(-1).astype(np.float32) / 2 ** 31
+        elif width == 4:
+            data = np.frombuffer(buffer, dtype="<i4", count=count, offset=offset).astype(np.float32) / 2 ** 31
+        else:
+            raise WaveFormatError(f"Unsupported PCM width {width}.")
+    else:
+        raise WaveFormatError(f"Unsupported format tag {header.format_tag:#x}.")
+
+    return data.reshape(-1, header.channels)
+
+
+def map_channels(data: np.ndarray, channels: int) -> np.ndarray:
+    source = data.shape[1]
+    if source == channels:
+        return data
+    if source == 1:
+        return np.repeat(data, channels, axis=1)
+    if channels == 1:
+        return data.mean(axis=1, keepdims=True, dtype=np.float32)
+    # surround and friends, keep the front pair
+    return data[:, :channels]
+
+
+def resample_linear(data: np.ndarray, source_rate: int, rate: int) -> np.ndarray:
+    divisor = math.gcd(source_rate, rate)
+    up = rate // divisor
+    down = source_rate // divisor
+    frames = int(round(data.shape[0] * rate / source_rate))
+
+    # output positions repeat every up frames, shifted down source frames on. so one period of whole and fractional
+    # parts covers everything and it all stays in float32, every channel of a frame gathered together
+    period = min(up, frames)
+    blocks = -(-frames // period)
+    phase = np.arange(period, dtype=np.intp) * down
+    base = (np.arange(0, blocks * down, down, dtype=np.intp)[:, None] + phase // up).reshape(-1)
+
+    # clipping holds the last frame for anything past the end, including the padding up to whole periods
+    left = data.take(base, axis=0, mode="clip")
+    out = data[1:].take(base, axis=0, mode="clip") if data.shape[0] > 1 else left.copy()
+    out -= left
+    out.reshape(blocks, period, -1)[...] *= ((phase % up) / up).astype(np.float32)[:, None]
+    out += left
+    return out[:frames]
+
+
+def resample_sinc(data: np.ndarray, source_rate: int, rate: int, taps: int = SINC_TAPS) -> np.ndarray:
+    divisor = math.gcd(source_rate, rate)
+    up = rate // divisor
+    down = source_rate // divisor
+    frames = int(round(data.shape[0] * rate / source_rate))
+
+    # lower the cutoff when downsampling so it doubles as the anti-aliasing filter
+    cutoff = min(1.0, up / down)
+    half = int(np.ceil(taps / 2 / cutoff))
+    offsets = np.arange(-half + 1, half + 1)
+
+    # polyphase table, one windowed sinc row per fractional position
+    phases = min(up, SINC_MAX_PHASES)
+    distance = (np.arange(phases) / phases)[:, None] - offsets[None, :]
+    table = cutoff * np.sinc(cutoff * distance) * (0.5 + 0.5 * np.cos(np.pi * distance / half))
+    table = (table / table.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    padded = np.zeros((data.shape[1], data.shape[0] + 2 * half + 1), dtype=np.float32)
+    padded[:, half:half + data.shape[0]] = data.T
+    windows = sliding_window_view(padded, 2 * half, axis=1)
+
+    out = np.empty((frames, data.shape[1]), dtype=np.float32)
+
+    # blocks keep the (channels, block, taps) gather small
+    for start in range(0, frames, SINC_BLOCK):
+        position = np.arange(start, min(start + SINC_BLOCK, frames), dtype=np.int64) * down
+        base = position // up
+        phase = (position % up) * phases // up
+        out[start:start + len(position)] = np.einsum("bt,cbt->bc", table[phase], windows[:, base + 1])
+
+    return out
+
+
+def resample(data: np.ndarray, source_rate: int, rate: int, quality: str = QUALITY_FAST) -> np.ndarray:
+    if source_rate == rate or data.shape[0] == 0:
+        return data
+    if quality == QUALITY_BEST:
+        return resample_sinc(data, source_rate, rate)
+    return resample_linear(data, source_rate, rate)
+
+
+def to_int16(data: np.ndarray) -> np.ndarray:
+    scaled = np.multiply(data, 32768, dtype=np.float32)
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    return scaled.astype(np.int16)
+
+
+def convert(buffer, header: WaveHeader, rate: int, channels: int, quality: str = QUALITY_FAST) -> np.ndarray:
+    if (header.format_tag == WAVE_FORMAT_PCM and header.sample_width == 2
+            and header.rate == rate and header.channels == channels):
+        # already the internal format, skip the float round trip
+        count = header.frames * header.channels
+        return np.frombuffer(buffer, dtype="<i2", count=count, offset=header.data_offset).reshape(-1, channels)
+
+    data = decode_pcm(buffer, header)
+    if header.channels > channels:
+        data = map_channels(data, channels)  # downmix before resampling so there is less to resample
+    data = resample(data, header.rate, rate, quality)
+    data = map_channels(data, channels)
+    return to_int16(data)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+
+from analysis import Analysis, content_hash
+from convert import QUALITY_FAST
+from ring import PCMRing
+from samples import Sample, load_sample
+from wavmap import WaveFormatError
+
+
+WAVE_EXTENSIONS = (".wav", ".wave")
+COMPRESSED_EXTENSIONS = (".mp3", ".ogg", ".oga", ".flac", ".opus", ".m4a", ".aac", ".wma")
+
+# compressed files at least this big only get their head decoded up front and stream the rest
+STREAM_THRESHOLD: int = 4 * 1024 * 1024
+STREAM_HEAD: float = 2  # seconds decoded into memory so a streamed sound starts without waiting on ffmpeg
+READ_AHEAD: float = 2  # seconds buffered per stream
+PIPE_BLOCK: int = 4096  # frames per pipe read
+
+
+class DecodeError(WaveFormatError):
+    # callers already treat WaveFormatError as "unsupported file"
+    pass
+
+
+def is_compressed(path: str) -> bool:
+    return path.lower().endswith(COMPRESSED_EXTENSIONS)
+
+
+def find_ffmpeg() -> str | None:
+    return shutil.which("ffmpeg")
+
+
+def ffmpeg_command(ffmpeg: str, path: str, rate: int, channels: int, offset: float = 0,
+                   duration: float | None = None) -> List[str]:
+    command = [ffmpeg, "-nostdin", "-v", "error"]
+    if offset:
+        # input side seek, still sample accurate since ffmpeg decodes and drops up to it
+        command += ["-ss", f"{offset:.6f}"]
+    command += ["-i", path]
+    if duration is not None:
+        command += ["-t", f"{duration:.6f}"]
+    return command + ["-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(channels), "-ar", str(rate), "-"]
+
+
+def decode_file(ffmpeg: str | None, path: str, rate: int, channels: int, duration: float | None = None) -> np.ndarray:
+    if ffmpeg is None:
+        raise DecodeError("ffmpeg is needed for compressed formats.")
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    result = subprocess.run(ffmpeg_command(ffmpeg, path, rate, channels, duration=duration),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise DecodeError(result.stderr.decode(errors="replace").strip() or f"ffmpeg failed on {path}.")
+
+    frame_bytes = channels * 2
+    pcm = result.stdout[:len(result.stdout) // frame_bytes * frame_bytes]
+    return np.frombuffer(pcm, dtype="<i2").reshape(-1, channels)
+
+
+def load_file(path: str, rate: int = 44100, channels: int = 2, quality: str = QUALITY_FAST,
+              ffmpeg: str | None = None) -> Sample:
+    # whole file into memory whatever the format, for callers that don't stream (e.g. the bulk import workers)
+    if not is_compressed(path):
+        return load_sample(path, rate, channels, quality)
+
+    with open(path, "rb") as f:
+        digest = content_hash(f.read())
+    return Sample(decode_file(ffmpeg or find_ffmpeg(), path, rate, channels), rate, path, digest)
+
+
+class DecodeStream:
+    # bounded pcm ring between one ffmpeg pipe (written by a pool thread) and one voice (read by the audio thread).
+    # reads never wait: whatever hasn't been decoded yet comes out as silence
+
+    def __init__(self, pool: DecoderPool, path: str, offset: int, capacity: int, channels: int):
+        self.pool = pool
+        self.path = path
+        self.offset = offset  # frames into the file the stream starts at
+        self.channels = channels
+        self.capacity = capacity
+
+        self._ring = PCMRing(capacity, channels)
+        self._out = np.zeros(capacity * channels, dtype=np.int16)
+        self._space = threading.Event()
+
+        self.eof: bool = False
+        self.closed: bool = False
+        self.underruns: int = 0
+
+    @property
+    def available(self) -> int:
+        return len(self._ring)
+
+    @property
+    def finished(self) -> bool:
+        return self.eof and self.available == 0
+
+    def read(self, frames: int) -> np.ndarray:
+        frames = min(frames, self.capacity)
+        out = self._out[:frames * self.channels].reshape(-1, self.channels)
+        n = self._ring.read_into(out, frames)
+        self._space.set()
+
+        if n < frames:
+            if self.eof:
+                return self._out[:n * self.channels]
+            # decoder fell behind, pad with silence rather than wait
+            out[n:] = 0
+            self.underruns += 1
+            self.pool.underruns += 1
+        return self._out[:frames * self.channels]
+
+    def write(self, pcm: np.ndarray) -> bool:
+        # pool thread side, blocks until there's room
+        i = 0
+        while i < len(pcm):
+            if self.closed:
+                return False
+            if self._ring.space == 0:
+                self._space.clear()
+                if self._ring.space == 0:
+                    self._space.wait(0.05)
+                continue
+            i += self._ring.write(pcm[i:])
+        return True
+
+    def close(self) -> None:
+        # called from the audio thread, the pump notices and tears ffmpeg down on its own thread
+        self.closed = True
+        self._space.set()
+
+
+class StreamingSample:
+    # a long compressed file: the head lives in memory like any other sample, the rest is decoded per voice
+    streaming: bool = True
+
+    def __init__(self, path: str, rate: int, head: np.ndarray, digest: str, pool: DecoderPool):
+        self.path = path
+        self.rate = rate
+        self.data = head
+        self.digest = digest
+        self.pool = pool
+        # loudness and silence need the whole file, so streamed sounds play as they are
+        self.analysis: Analysis | None = None
+
+    @property
+    def frames(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def channels(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def open_stream(self) -> DecodeStream:
+        return self.pool.open(self.path, self.frames)
+
+
+class DecoderPool:
+    def __init__(self, rate: int = 44100, channels: int = 2, workers: int = 16, ffmpeg: str | None = None):
+        self.rate = rate
+        self.channels = channels
+        self.ffmpeg = ffmpeg or find_ffmpeg()
+
+        # every live stream holds a thread for as long as it plays, so this bounds concurrent streams too
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="Decoder")
+        self._streams: set[DecodeStream] = set()
+        self._lock = threading.Lock()
+
+        self.underruns: int = 0
+
+    @property
+    def active(self) -> int:
+        return len(self._streams)
+
+    def handles(self, path: str) -> bool:
+        return is_compressed(path)
+
+    def load(self, path: str) -> Sample | StreamingSample:
+        with open(path, "rb") as f:
+            digest = content_hash(f.read())
+
+        if os.path.getsize(path) < STREAM_THRESHOLD:
+            return Sample(decode_file(self.ffmpeg, path, self.rate, self.channels), self.rate, path, digest)
+
+        head = decode_file(self.ffmpeg, path, self.rate, self.channels, STREAM_HEAD)
+        if head.shape[0] < int(STREAM_HEAD * self.rate):
+            return Sample(head, self.rate, path, digest)  # the whole thing fit in the head after all
+        return StreamingSample(path, self.rate, head, digest, self)
+
+    def open(self, path: str, offset: int) -> DecodeStream:
+        stream = DecodeStream(self, path, offset, int(READ_AHEAD * self.rate), self.channels)
+        with self._lock:
+            self._streams.add(stream)
+        self._executor.submit(self.pump, stream)
+        return stream
+
+    def pump(self, stream: DecodeStream) -> None:
+        process = None
+        try:
+            if stream.closed:
+                return
+            process = subprocess.Popen(
+                ffmpeg_command(self.ffmpeg, stream.path, self.rate, self.channels, stream.offset / self.rate),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+            frame_bytes = self.channels * 2
+            leftover = b""
+            while not stream.closed:
+                pcm = process.stdout.read(PIPE_BLOCK * frame_bytes)
+                if not pcm:
+                    break
+                pcm = leftover + pcm
+                whole = len(pcm) // frame_bytes * frame_bytes
+                pcm, leftover = pcm[:whole], pcm[whole:]
+                if not stream.write(np.frombuffer(pcm, dtype="<i2").reshape(-1, self.channels)):
+                    break
+        except OSError:
+            pass  # plays out as silence, the file was checked when the head was decoded
+        finally:
+            stream.eof = True
+            if process is not None:
+                process.kill()
+                process.wait()
+            with self._lock:
+                self._streams.discard(stream)
+
+    def close(self) -> None:
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            stream.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import json
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import List
+
+import numpy as np
+
+from backends import DeviceParameters
+
+
+# device info fields worth keeping, pyaudio hands back a few more
+DEVICE_FIELDS = ("index", "name", "maxInputChannels", "maxOutputChannels", "defaultSampleRate")
+
+
+def bind_chunk(open_stream, engine):
+    # swaps happen at whatever period the engine is running at right now
+    return lambda index: open_stream(index, engine.chunk)
+
+
+class DeviceManager:
+    # cached device enumeration plus opening streams off the calling thread.
+    # a swap opens and warms the new stream up first, then the engine switches to it between two chunks
+
+    def __init__(self, backend, cache_path: str | None = None):
+        self.backend = backend
+        self.cache_path = cache_path
+
+        self.devices: List[DeviceParameters] = []
+        # what the engine is currently running on, so a resize knows what to reopen
+        self.input_index: int | None = None
+        self.output_index: int | None = None
+        self._lock = threading.Lock()
+        # held from opening a replacement stream until the engine has it, so a swap and a resize can't each put
+        # the engine on a different device. the indices only change under it too
+        self._switch_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(3, thread_name_prefix="Device")
+
+        if cache_path is not None:
+            try:
+                with open(cache_path) as f:
+                    self.devices = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError):
+                traceback.print_exc()
+
+    @property
+    def input_devices(self) -> List[DeviceParameters]:
+        return [device for device in self.devices if device["maxInputChannels"] > 0]
+
+    @property
+    def output_devices(self) -> List[DeviceParameters]:
+        return [device for device in self.devices if device["maxOutputChannels"] > 0]
+
+    def refresh(self) -> bool:
+        # walks every device through the backend, so keep it off the gui thread. returns whether anything changed
+        devices = [{key: device[key] for key in DEVICE_FIELDS if key in device} for device in self.backend.devices()]
+        with self._lock:
+            changed = devices != self.devices
+            self.devices = devices
+
+        if changed and self.cache_path is not None:
+            try:
+                with open(self.cache_path, "w") as f:
+                    json.dump(devices, f)
+            except OSError:
+                traceback.print_exc()
+        return changed
+
+    def refresh_async(self) -> Future:
+        return self._executor.submit(self.refresh)
+
+    def open_input(self, index: int, chunk: int | None = None):
+        chunk = chunk or self.backend.chunk
+        stream = self.backend.open_input(index, chunk)
+        # the first read blocks until the device is actually delivering
+        stream.read(chunk, exception_on_overflow=False)
+        return stream
+
+    def open_output(self, index: int, chunk: int | None = None):
+        chunk = chunk or self.backend.chunk
+        stream = self.backend.open_output(index, chunk)
+        # queue a chunk of silence so the device is running before real audio shows up
+        stream.write(np.zeros(chunk * self.backend.channels * 2, dtype=np.uint8))
+        return stream
+
+    def open_streams(self, input_index: int, output_index: int, echo_index: int, chunk: int | None = None) -> tuple:
+        # all three at once rather than one after another. the echo side keeps the default chunk, it has its
+        # own jitter buffer and never follows the engine's period
+        futures = (
+            self._executor.submit(self.open_input, input_index, chunk),
+            self._executor.submit(self.open_output, output_index, chunk),
+            self._executor.submit(self.open_output, echo_index),
+        )
+        # every open has to finish before giving up on any of them, one still running would never be closed
+        wait(futures)
+        error = next((future.exception() for future in futures if future.exception() is not None), None)
+        if error is not None:
+            for future in futures:
+                if future.exception() is None:
+                    future.result().close()
+            raise error
+
+        with self._switch_lock:
+            self.input_index = input_index
+            self.output_index = output_index
+        return tuple(future.result() for future in futures)
+
+    def swap_input(self, engine, index: int) -> Future:
+        return self._executor.submit(self._swap, engine, bind_chunk(self.open_input, engine),
+                                     engine.set_input_stream, index, "input_index")
+
+    def swap_output(self, engine, index: int) -> Future:
+        return self._executor.submit(self._swap, engine, bind_chunk(self.open_output, engine),
+                                     engine.set_output_stream, index, "output_index")
+
+    def swap_echo(self, engine, index: int) -> Future:
+        return self._executor.submit(self._swap, engine, self.open_output, engine.set_echo_stream, index)
+
+    def _swap(self, engine, open_stream, set_stream, index: int, name: str | None = None) -> None:
+        with self._switch_lock:
+            try:
+                stream = open_stream(index)
+            except Exception:
+                # the old device keeps playing
+                traceback.print_exc()
+                raise
+
+            if set_stream(stream) and name is not None:
+                setattr(self, name, index)
+        engine.close_retired()
+
+    def resize(self, engine, chunk: int) -> Future:
+        return self._executor.submit(self._resize, engine, chunk)
+
+    def _resize(self, engine, chunk: int) -> None:
+        # a new period size means new streams. both are opened and running before the engine lets go of the old
+        # ones, and the old output is drained rather than cut, so the switch doesn't drop out. opened right here
+        # rather than on the other workers, waiting on this same pool from inside it could deadlock
+        with self._switch_lock:
+            output_stream = self.open_output(self.output_index, chunk)
+            try:
+                input_stream = self.open_input(self.input_index, chunk)
+            except Exception:
+                output_stream.close()
+                raise
+            resized = engine.set_chunk(chunk, input_stream, output_stream)
+        if resized:
+            engine.close_retired()
+            engine.close_retired()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
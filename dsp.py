@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import math
+from typing import List
+
+import numpy as np
+
+
+FULL_SCALE: float = 32768  # the mic row is int16 scaled floats
+
+HIGHPASS: str = "highpass"
+GATE: str = "gate"
+COMPRESSOR: str = "compressor"
+LIMITER: str = "limiter"
+
+EXP_LIMIT: float = 500  # largest exponent a recursion block may reach, float64 tops out around 709
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20)
+
+
+def coefficient(seconds: float, rate: int) -> float:
+    # one pole smoothing coefficient for a time constant
+    return math.exp(-1 / max(seconds * rate, 1e-6))
+
+
+class OnePole:
+    # y[n] = a * y[n - 1] + x[n] for a whole block at once. unrolled, y[n] = a^(n+1) * (y[-1] + sum x[k] a^-(k+1)),
+    # so one cumsum per step, and steps are kept short enough that a^-step can't overflow
+
+    def __init__(self, a: float, channels: int = 1):
+        self.a = a
+        self.step = max(1, min(1024, int(EXP_LIMIT / max(-math.log(a), 1e-12)))) if a > 0 else 1
+        exponents = np.arange(1, self.step + 1, dtype=np.float64)
+        self.grow = a ** exponents  # a^(n+1)
+        self.shrink = 1 / self.grow if a > 0 else np.zeros(self.step)  # a^-(k+1)
+        self.state = np.zeros(channels, dtype=np.float64)
+
+    def reset(self) -> None:
+        self.state[:] = 0
+
+    def run(self, x: np.ndarray) -> np.ndarray:
+        # x is (frames, channels), filtered into a new float64 array
+        if self.a == 0:
+            self.state[:] = x[-1]
+            return x.astype(np.float64)
+
+        y = np.empty(x.shape, dtype=np.float64)
+        for i in range(0, len(x), self.step):
+            block = x[i:i + self.step]
+            n = len(block)
+            acc = np.cumsum(block * self.shrink[:n, None], axis=0)
+            acc += self.state
+            acc *= self.grow[:n, None]
+            y[i:i + n] = acc
+            self.state[:] = acc[-1]
+        return y
+
+
+def peak_envelope(level: np.ndarray, decay: float, state: float) -> np.ndarray:
+    # instant attack, exponential release: env[n] = max(level[n], env[n-1] * decay). in the log domain that's a
+    # running maximum of log level[k] - k log decay, shifted back by n log decay
+    log_decay = math.log(decay)
+    n = np.arange(1, len(level) + 1, dtype=np.float64)
+    log_level = np.log(np.maximum(level, 1e-9))
+    log_env = np.maximum.accumulate(np.maximum(log_level - n * log_decay, math.log(max(state, 1e-9))))
+    log_env += n * log_decay
+    return np.exp(log_env)
+
+
+class Stage:
+    name: str = ""
+
+    def __init__(self, rate: int, channels: int):
+        self.rate = rate
+        self.channels = channels
+        self.enabled: bool = False
+
+    def reset(self) -> None:
+        pass
+
+    def process(self, x: np.ndarray) -> None:
+        # x is (frames, channels) float32, processed in place
+        raise NotImplementedError
+
+
+class HighPass(Stage):
+    # two first order sections, 12db an octave below the cutoff. takes out desk thumps and rumble
+    name = HIGHPASS
+
+    def __init__(self, rate: int, channels: int, cutoff: float = 80):
+        super().__init__(rate, channels)
+        self.a = math.exp(-2 * math.pi * cutoff / rate)
+        self.sections = [OnePole(self.a, channels), OnePole(self.a, channels)]
+        self.previous = [np.zeros(channels), np.zeros(channels)]
+
+    def reset(self) -> None:
+        for section, previous in zip(self.sections, self.previous):
+            section.reset()
+            previous[:] = 0
+
+    def process(self, x: np.ndarray) -> None:
+        y = x.astype(np.float64)
+        for section, previous in zip(self.sections, self.previous):
+            # y[n] = a * (y[n-1] + x[n] - x[n-1])
+            difference = np.diff(y, axis=0, prepend=previous[None])
+            previous[:] = y[-1]
+            y = section.run(difference * self.a)
+        np.copyto(x, y, casting="unsafe")
+
+
+class NoiseGate(Stage):
+    # the detector holds open through gaps between words, the gain then eases in and out so keys clicking between
+    # sentences are pulled down without chopping the start of the next one
+    name = GATE
+
+    def __init__(self, rate: int, channels: int, threshold_db: float = -45, floor_db: float = -60,
+                 hold: float = 0.15, smoothing: float = 0.005):
+        super().__init__(rate, channels)
+        self.threshold = db_to_gain(threshold_db) * FULL_SCALE
+        self.floor = db_to_gain(floor_db)
+        self.decay = coefficient(hold, rate)
+        self.smoothing = coefficient(smoothing, rate)
+        self.gain = OnePole(self.smoothing)
+        self.envelope: float = 0
+
+    def reset(self) -> None:
+        self.gain.reset()
+        self.envelope = 0
+
+    def process(self, x: np.ndarray) -> None:
+        envelope = peak_envelope(np.abs(x).max(axis=1), self.decay, self.envelope)
+        self.envelope = float(envelope[-1])
+        target = np.where(envelope >= self.threshold, 1.0, self.floor)
+        gain = self.gain.run((target * (1 - self.smoothing))[:, None])
+        x *= gain
+
+
+class Compressor(Stage):
+    # feed forward, linked stereo, soft knee
+    name = COMPRESSOR
+
+    def __init__(self, rate: int, channels: int, threshold_db: float = -24, ratio: float = 4, knee_db: float = 6,
+                 attack: float = 0.005, release: float = 0.12, makeup_db: float = 6):
+        super().__init__(rate, channels)
+        self.threshold_db = threshold_db
+        self.ratio = ratio
+        self.knee_db = knee_db
+        self.makeup_db = makeup_db
+        self.decay = coefficient(release, rate)
+        self.attack = coefficient(attack, rate)
+        self.reduction = OnePole(self.attack)
+        self.envelope: float = 0
+
+    def reset(self) -> None:
+        self.reduction.reset()
+        self.envelope = 0
+
+    def process(self, x: np.ndarray) -> None:
+        envelope = peak_envelope(np.abs(x).max(axis=1), self.decay, self.envelope)
+        self.envelope = float(envelope[-1])
+
+        level_db = 20 * np.log10(np.maximum(envelope, 1e-9) / FULL_SCALE)
+        over = level_db - self.threshold_db
+        slope = 1 - 1 / self.ratio
+        half = self.knee_db / 2
+        reduction = np.where(over <= -half, 0.0,
+                             np.where(over >= half, over * slope, slope * (over + half) ** 2 / (2 * self.knee_db)))
+
+        reduction = self.reduction.run((reduction * (1 - self.attack))[:, None])
+        x *= 10 ** ((self.makeup_db - reduction) / 20)
+
+
+class Limiter(Stage):
+    # brickwall on the mic alone, before it's summed with the sounds and their own limiter
+    name = LIMITER
+
+    def __init__(self, rate: int, channels: int, ceiling_db: float = -1, release: float = 0.05):
+        super().__init__(rate, channels)
+        self.ceiling = db_to_gain(ceiling_db) * FULL_SCALE
+        self.decay = coefficient(release, rate)
+        self.envelope: float = 0
+
+    def reset(self) -> None:
+        self.envelope = 0
+
+    def process(self, x: np.ndarray) -> None:
+        # the envelope never undershoots a peak, so dividing by it can't let one through
+        envelope = peak_envelope(np.abs(x).max(axis=1), self.decay, self.envelope)
+        self.envelope = float(envelope[-1])
+        x *= np.minimum(1, self.ceiling / np.maximum(envelope, 1e-9))[:, None]
+
+
+class EffectChain:
+    # mic effects, run on the audio thread on each chunk before it's mixed. stages are bypassed individually
+
+    def __init__(self, rate: int, channels: int, enabled: dict[str, bool] | None = None):
+        self.stages: List[Stage] = [
+            HighPass(rate, channels),
+            NoiseGate(rate, channels),
+            Compressor(rate, channels),
+            Limiter(rate, channels),
+        ]
+        for name, on in (enabled or {}).items():
+            self.set_enabled(name, on)
+
+    def stage(self, name: str) -> Stage:
+        return next(stage for stage in self.stages if stage.name == name)
+
+    @property
+    def enabled(self) -> bool:
+        return any(stage.enabled for stage in self.stages)
+
+    def set_enabled(self, name: str, enabled: bool) -> None:
+        stage = self.stage(name)
+        if enabled and not stage.enabled:
+            # whatever state it had is from before it was bypassed
+            stage.reset()
+        stage.enabled = enabled
+
+    def process(self, x: np.ndarray) -> None:
+        for stage in self.stages:
+            if stage.enabled:
+                stage.process(x)
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+import numpy as np
+
+from backends import OUTPUT_UNDERFLOWED
+from ring import PCMRing
+from stats import EngineStats
+
+
+SMOOTHING: float = 0.05  # per chunk weight of the newest fill level, evens out the chunk sized sawtooth
+RESYNC_CHUNKS: int = 8  # this many chunks past the target stops nudging and just jumps back
+CAPACITY: float = 2  # seconds the jitter buffer can hold
+
+
+class EchoOutput:
+    # the monitor device runs on its own thread behind a jitter buffer, so a slow or drifting headphone clock
+    # can never hold up the cable. the audio thread only ever copies into the ring
+
+    def __init__(self, stream, chunk: int, channels: int, rate: int, stats: EngineStats, latency: float = 0.06,
+                 enabled: bool = True, retired: queue.SimpleQueue | None = None):
+        self.stream = stream
+        self.chunk = chunk
+        self.channels = channels
+        self.rate = rate
+        self.stats = stats
+        self.enabled = enabled
+        # where swapped out streams go to be closed, closed right here if None
+        self.retired = retired
+
+        self.ring = PCMRing(int(CAPACITY * rate), channels)
+        self.target: int = 0
+        self.set_latency(latency)
+
+        self._pending_stream = None
+        self._pending_lock = threading.Lock()
+        self._pushed = threading.Event()
+
+        self._silence = np.zeros(chunk * channels * 2, dtype=np.uint8)
+        self._pulled = np.zeros((chunk + 1, channels), dtype=np.int16)
+        self._out = np.zeros((chunk, channels), dtype=np.int16)
+        self._out_bytes = self._out.reshape(-1).view(np.uint8)
+        # linear interpolation from chunk +- 1 pulled frames onto chunk output frames
+        self._stretch = {n: self.interpolation(n) for n in (chunk - 1, chunk + 1)}
+
+        self.level: float = 0
+        self.primed: bool = False
+
+        self._running: bool = False
+        self._thread: threading.Thread | None = None
+
+    def interpolation(self, n: int) -> tuple[np.ndarray, np.ndarray]:
+        position = np.arange(self.chunk) * (n - 1) / (self.chunk - 1)
+        index = np.minimum(position.astype(np.int64), n - 2)
+        return index, (position - index).astype(np.float32)[:, None]
+
+    def set_latency(self, latency: float) -> None:
+        # anything under a chunk would starve every cycle, and it needs room above the target to absorb jitter
+        self.target = min(max(self.chunk, int(latency * self.rate)), self.ring.capacity // 2)
+        self.primed = False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name="EchoOutput", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        self._pushed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+        self._swap_stream()
+        self.stream.close()
+
+    def set_stream(self, stream) -> None:
+        # picked up by the echo thread between writes
+        with self._pending_lock:
+            previous, self._pending_stream = self._pending_stream, stream
+        if previous is not None:
+            previous.close()
+
+    def _swap_stream(self) -> None:
+        with self._pending_lock:
+            stream, self._pending_stream = self._pending_stream, None
+        if stream is not None:
+            if self.retired is not None:
+                self.retired.put(self.stream)
+            else:
+                self.stream.close()
+            self.stream = stream
+            self.primed = False
+
+    def push(self, frames: np.ndarray) -> None:
+        # audio thread. never waits: with no room the chunk is dropped and the echo thread resyncs later
+        if not self.enabled:
+            return
+        pcm = frames.view(np.int16).reshape(-1, self.channels)
+        # the engine's period can change under it, so go by what actually arrived
+        if self.ring.space < len(pcm):
+            self.stats.echo_overflows += 1
+        else:
+            self.ring.write(pcm)
+        self._pushed.set()
+
+    def run(self) -> None:
+        while self._running:
+            self._swap_stream()
+            self.write(self.pull())
+
+    def pull(self) -> np.ndarray:
+        level = len(self.ring)
+
+        if not self.primed:
+            if level < self.target:
+                # fill up to the target before playing, and keep the device fed meanwhile
+                self._pushed.clear()
+                self._pushed.wait(self.chunk / self.rate / 2)
+                return self._silence
+            self.primed = True
+            self.level = level
+
+        if level < self.chunk:
+            # the cable side stalled or echo was just switched off
+            self.primed = False
+            if self.enabled:
+                self.stats.echo_starved += 1
+            return self._silence
+
+        self.level += (level - self.level) * SMOOTHING
+
+        if self.level > self.target + RESYNC_CHUNKS * self.chunk:
+            skipped = self.ring.skip(level - self.target)
+            self.stats.echo_dropped += skipped
+            self.stats.echo_resyncs += 1
+            self.level = self.target
+            level -= skipped
+
+        # the two clocks never quite agree, so nudge the fill level back to the target one frame a chunk at a time.
+        # it's sampled just before a pull, so on average it sits half a chunk above where the pulls leave it
+        n = self.chunk
+        centre = self.target + self.chunk // 2
+        if self.level > centre + self.chunk and level > self.chunk:
+            n = self.chunk + 1
+            self.stats.echo_dropped += 1
+        elif self.level < centre - self.chunk:
+            n = self.chunk - 1
+            self.stats.echo_duplicated += 1
+
+        if n == self.chunk:
+            self.ring.read_into(self._out, n)
+        else:
+            self.ring.read_into(self._pulled, n)
+            index, fraction = self._stretch[n]
+            low = self._pulled[index].astype(np.float32)
+            high = self._pulled[index + 1]
+            np.copyto(self._out, np.rint(low + (high - low) * fraction), casting="unsafe")
+        return self._out_bytes
+
+    def write(self, frames: np.ndarray) -> None:
+        try:
+            self.stream.write(frames, exception_on_underflow=True)
+        except OSError as error:
+            if error.args[-1] != OUTPUT_UNDERFLOWED:
+                raise
+            self.stats.echo_underruns += 1
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from backends import OUTPUT_UNDERFLOWED
+from dsp import EffectChain
+from echo import EchoOutput
+from mixer import LIMIT_SOFT, Mixer, Voice
+from ring import SPSCRing
+from scheduler import ScheduledEvent, Scheduler
+from stats import EngineStats
+
+
+PLAY: int = 0
+STOP: int = 1
+SET_VOLUME: int = 2
+CALL: int = 3
+SCHEDULE: int = 4
+
+
+class Command:
+    __slots__ = ("kind", "spec", "payload", "timestamp")
+
+    def __init__(self, kind: int, spec=None, payload=None, timestamp: int = 0):
+        self.kind = kind
+        self.spec = spec
+        self.payload = payload
+        # perf_counter_ns() at the moment the trigger happened
+        self.timestamp = timestamp
+
+
+class AudioEngine:
+    COMMAND_RING_SIZE: int = 256
+
+    def __init__(self, chunk: int, channels: int, input_stream, output_stream, echo_stream, echo: bool = True,
+                 max_voices: int = 16, limiter: str = LIMIT_SOFT, rate: int = 44100, echo_latency: float = 0.06,
+                 effects: dict[str, bool] | None = None):
+        self.chunk = chunk
+        self.channels = channels
+        self.rate = rate
+
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+
+        # one ring per producing thread (pynput, tk, ...) so every ring stays single producer
+        self.rings: List[SPSCRing[Command]] = []
+        self._rings_by_thread: dict[int, SPSCRing[Command]] = {}
+        self._rings_lock = threading.Lock()
+
+        # only ever touched on the audio thread
+        self.mixer = Mixer(chunk, channels, max_voices, limiter)
+        self.effects = EffectChain(rate, channels, effects)
+        self.mixer.effects = self.effects
+        self.scheduler = Scheduler(self.mixer)
+        # frames mixed so far, the clock scheduled events are keyed to. the chunk being mixed starts at this frame
+        self.clock: int = 0
+
+        self.stats = EngineStats(chunk / rate)
+        # the input stream's own overflow count as of the last read
+        self._overflows_stream = None
+        self._overflows_seen: int = 0
+        # streams swapped out, waiting for close_retired. portaudio can take a while to close one,
+        # which the audio (or echo) thread can't afford
+        self.retired: queue.SimpleQueue = queue.SimpleQueue()
+        # the monitor gets its own thread so it can't hold up the cable
+        self.echo_output = EchoOutput(echo_stream, chunk, channels, rate, self.stats, echo_latency, echo,
+                                      self.retired)
+
+        # replay.ReplayBuffer getting a copy of everything written to the cable
+        self.replay = None
+
+        # (chunk, input stream, output stream) applied once the current chunk is out
+        self._pending_resize: tuple | None = None
+
+        self._running: bool = False
+        self._thread: threading.Thread | None = None
+
+    @property
+    def echo(self) -> bool:
+        return self.echo_output.enabled
+
+    @echo.setter
+    def echo(self, echo: bool) -> None:
+        # plain attribute reads/writes are atomic so the gui can flip this directly
+        self.echo_output.enabled = echo
+
+    @property
+    def echo_stream(self):
+        return self.echo_output.stream
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self.echo_output.start()
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name="AudioEngine", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.echo_output.stop()
+
+    def close(self) -> None:
+        self.stop()
+
+        # drain anything that arrived after the loop exited so streams passed in are not leaked
+        self.process_commands()
+
+        self.input_stream.close()
+        self.output_stream.close()
+        self.echo_output.close()
+        if self._pending_resize is not None:
+            _, input_stream, output_stream = self._pending_resize
+            input_stream.close()
+            output_stream.close()
+        while not self.retired.empty():
+            self.retired.get().close()
+
+        self.scheduler.cancel()
+        self.mixer.clear()
+
+    def _ring(self) -> SPSCRing[Command]:
+        ident = threading.get_ident()
+        ring = self._rings_by_thread.get(ident)
+        if ring is None:
+            with self._rings_lock:
+                ring = SPSCRing(self.COMMAND_RING_SIZE)
+                self._rings_by_thread[ident] = ring
+                self.rings = self.rings + [ring]
+        return ring
+
+    def push(self, command: Command) -> bool:
+        # never block the caller (the pynput thread or tk), just drop the command when the ring is full
+        return self._ring().push(command)
+
+    def send(self, command: Callable, *args) -> bool:
+        return self.push(Command(CALL, payload=(command, args)))
+
+    def play(self, spec, sample, timestamp: int | None = None,
+             start: int = 0, end: int | None = None, normalization: float = 1, stream=None) -> bool:
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        # the voice is built here on the caller's thread, the audio thread only links it in
+        voice = Voice(spec, sample, timestamp=timestamp, start=start, end=end, normalization=normalization,
+                      stream=stream)
+        return self.play_voice(voice, timestamp)
+
+    def play_voice(self, voice: Voice, timestamp: int | None = None) -> bool:
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        voice.timestamp = timestamp
+        if not self.push(Command(PLAY, voice.spec, voice, timestamp)):
+            voice.close()
+            return False
+        return True
+
+    def schedule(self, events: List[ScheduledEvent], timestamp: int | None = None) -> bool:
+        # event times are frames from the chunk that picks the command up, so they stay exact relative to each other
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        for event in events:
+            if event.voice is not None:
+                event.voice.timestamp = timestamp if event.at == 0 else 0
+        if not self.push(Command(SCHEDULE, payload=events, timestamp=timestamp)):
+            for event in events:
+                if event.voice is not None:
+                    event.voice.close()
+            return False
+        return True
+
+    def stop_sound(self, spec=None) -> bool:
+        return self.push(Command(STOP, spec))
+
+    def set_volume(self, spec, volume: float) -> bool:
+        return self.push(Command(SET_VOLUME, spec, volume))
+
+    def set_max_voices(self, max_voices: int) -> bool:
+        return self.send(self.mixer.set_max_voices, max_voices)
+
+    def set_limiter(self, limiter: str) -> bool:
+        return self.send(self.mixer.set_limiter, limiter)
+
+    def set_effect(self, name: str, enabled: bool) -> bool:
+        return self.send(self.effects.set_enabled, name, enabled)
+
+    def set_input_stream(self, stream) -> bool:
+        return self.send_stream("input_stream", stream)
+
+    def set_output_stream(self, stream) -> bool:
+        return self.send_stream("output_stream", stream)
+
+    def set_echo_stream(self, stream) -> bool:
+        # swapped by the echo thread itself, the audio thread never touches the echo stream
+        self.echo_output.set_stream(stream)
+        return True
+
+    def set_echo_latency(self, latency: float) -> None:
+        self.echo_output.set_latency(latency)
+
+    def send_stream(self, name: str, stream) -> bool:
+        if not self.send(self._set_stream, name, stream):
+            stream.close()
+            return False
+        return True
+
+    def _set_stream(self, name: str, stream) -> None:
+        self.retired.put(getattr(self, name))
+        setattr(self, name, stream)
+
+    def close_retired(self, timeout: float = 1) -> None:
+        # waits for the swap to land at the next chunk boundary, then closes whatever it replaced
+        try:
+            stream = self.retired.get(timeout=timeout)
+        except queue.Empty:
+            return  # not running yet, close() picks it up
+        if hasattr(stream, "stop_stream"):
+            # let what's already queued play out rather than cut it off, the new stream is running by now
+            stream.stop_stream()
+        stream.close()
+
+    def set_chunk(self, chunk: int, input_stream, output_stream) -> bool:
+        # both streams have to already be open at the new period size
+        if not self.send(self._set_chunk, chunk, input_stream, output_stream):
+            input_stream.close()
+            output_stream.close()
+            return False
+        return True
+
+    def _set_chunk(self, chunk: int, input_stream, output_stream) -> None:
+        # this chunk's input was already read at the old size, so wait for it to go out
+        self._pending_resize = (chunk, input_stream, output_stream)
+
+    def _resize(self) -> None:
+        chunk, input_stream, output_stream = self._pending_resize
+        self._pending_resize = None
+
+        self._set_stream("input_stream", input_stream)
+        self._set_stream("output_stream", output_stream)
+        self.chunk = chunk
+        self.mixer.set_chunk(chunk)
+        self.stats.set_period(chunk / self.rate)
+
+    def process_commands(self) -> None:
+        self.stats.record_queue_depth(self.queue_depth())
+        for ring in self.rings:
+            command = ring.pop()
+            while command is not None:
+                self.execute(command)
+                command = ring.pop()
+
+    def execute(self, command: Command) -> None:
+        if command.kind == PLAY:
+            self.mixer.add(command.payload)
+        elif command.kind == STOP:
+            self.mixer.stop(command.spec)
+            self.scheduler.cancel(command.spec)
+        elif command.kind == SET_VOLUME:
+            for voice in self.mixer.voices:
+                if voice.spec is command.spec:
+                    voice.volume = command.payload
+        elif command.kind == CALL:
+            f, args = command.payload
+            f(*args)
+        elif command.kind == SCHEDULE:
+            for event in command.payload:
+                event.at += self.clock
+                self.scheduler.add(event)
+
+    def run(self) -> None:
+        while self._running:
+            self.process_chunk()
+
+    def queue_depth(self) -> int:
+        return sum(len(ring) for ring in self.rings)
+
+    def read_input(self) -> np.ndarray:
+        # raising on an overflow makes pyaudio throw away a chunk it read fine, so the streams count their own from
+        # what the device reports and the engine picks up the difference
+        stream = self.input_stream
+        data = np.frombuffer(stream.read(self.chunk, exception_on_overflow=False), dtype=np.int16)
+        overflows = stream.overflows
+        self.stats.input_overflows += overflows - (self._overflows_seen if stream is self._overflows_stream else 0)
+        self._overflows_stream, self._overflows_seen = stream, overflows
+        return data
+
+    def process_chunk(self) -> None:
+        mic = self.read_input()
+        # drain after the blocking read so triggers that arrived during it make this chunk
+        self.process_commands()
+
+        start = time.perf_counter()
+        if self.scheduler.events:
+            self.scheduler.run(self.clock, self.chunk)
+        frames = self.mixer.mix(mic)
+        self.stats.record_chunk(time.perf_counter() - start)
+
+        self.write_output(frames)
+        self.clock += self.chunk
+
+        if self.mixer.started:
+            now = time.perf_counter_ns()
+            for voice in self.mixer.started:
+                # delayed and looped passes weren't waited on by anyone
+                if voice.timestamp:
+                    self.stats.record_latency(now - voice.timestamp)
+
+        if self._pending_resize is not None:
+            self._resize()
+
+    def write_output(self, frames: np.ndarray) -> None:
+        if self.write_stream(self.output_stream, frames):
+            self.stats.output_underruns += 1
+        self.echo_output.push(frames)
+        if self.replay is not None:
+            self.replay.write(frames.view(np.int16).reshape(-1, self.channels))
+
+    @staticmethod
+    def write_stream(stream, frames: np.ndarray) -> bool:
+        try:
+            stream.write(frames, exception_on_underflow=True)
+        except OSError as error:
+            if error.args[-1] != OUTPUT_UNDERFLOWED:
+                raise
+            # the frames still went out, the device just ran dry before they arrived
+            return True
+        return False
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from typing import Hashable, Iterable, List
+
+
+Chord = frozenset
+
+
+class HotkeyIndex:
+    def __init__(self, specs: Iterable = ()):
+        self._chords: dict[Chord, List] = {}
+        # key -> every chord containing it, longest first
+        self._by_key: dict[Hashable, List[Chord]] = {}
+        self._bound: dict[object, Chord] = {}
+
+        self.rebuild(specs)
+
+    def __len__(self) -> int:
+        return len(self._bound)
+
+    def rebuild(self, specs: Iterable) -> None:
+        self._chords = {}
+        self._by_key = {}
+        self._bound = {}
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec) -> None:
+        chord = Chord(spec.keys)
+        if len(chord) == 0:
+            return
+
+        self._bound[spec] = chord
+
+        specs = self._chords.get(chord)
+        if specs is not None:
+            # lists are replaced rather than mutated so the listener thread never sees a half update
+            self._chords[chord] = specs + [spec]
+            return
+
+        self._chords[chord] = [spec]
+        for key in chord:
+            chords = self._by_key.get(key, []) + [chord]
+            chords.sort(key=len, reverse=True)
+            self._by_key[key] = chords
+
+    def remove(self, spec) -> None:
+        chord = self._bound.pop(spec, None)
+        if chord is None:
+            return
+
+        specs = [other for other in self._chords[chord] if other is not spec]
+        if specs:
+            self._chords[chord] = specs
+            return
+
+        del self._chords[chord]
+        for key in chord:
+            chords = [other for other in self._by_key[key] if other != chord]
+            if chords:
+                self._by_key[key] = chords
+            else:
+                del self._by_key[key]
+
+    def update(self, spec) -> None:
+        if self._bound.get(spec) == Chord(spec.keys):
+            return
+        self.remove(spec)
+        self.add(spec)
+
+    def match(self, key: Hashable, held: set) -> List:
+        # only chords containing the key that was just pressed can have become satisfied
+        matched = []
+        longest = 0
+        for chord in self._by_key.get(key, ()):
+            if len(chord) < longest:
+                break
+            if chord <= held:
+                longest = len(chord)
+                matched.extend(self._chords[chord])
+        return matched
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, List
+
+import numpy as np
+
+from analysis import Analysis, analyse
+from convert import QUALITY_FAST
+from decoders import WAVE_EXTENSIONS, load_file
+from wavmap import WaveFormatError
+
+
+BATCH: int = 16  # files per task, so thousands of tiny clips don't drown in ipc
+# decoded data bigger than this isn't shipped back, the cache maps or decodes it itself on first use
+MAX_TRANSFER: int = 8 * 1024 * 1024
+
+
+def find_audio_files(root: str, extensions: Iterable[str] = WAVE_EXTENSIONS) -> List[str]:
+    extensions = tuple(extensions)
+    paths = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(extensions):
+                paths.append(os.path.join(directory, file))
+    return paths
+
+
+class ImportResult:
+    def __init__(self, path: str, mtime: float = 0, digest: str = "", frames: int = 0, rate: int = 0,
+                 analysis: Analysis | None = None, data: np.ndarray | None = None, error: str = ""):
+        self.path = path
+        self.mtime = mtime
+        self.digest = digest
+        self.frames = frames
+        self.rate = rate
+        self.analysis = analysis
+        # (frames, channels) int16 in the internal format, None when too big to ship or on error
+        self.data = data
+        self.error = error
+
+    @property
+    def name(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.rate if self.rate else 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+
+def probe(path: str, rate: int, channels: int, quality: str) -> ImportResult:
+    # runs in a worker process: decode (through ffmpeg for compressed formats), convert, validate and analyse
+    try:
+        mtime = os.stat(path).st_mtime
+        sample = load_file(path, rate, channels, quality)
+    except (OSError, WaveFormatError, ValueError) as e:
+        return ImportResult(path, error=str(e) or type(e).__name__)
+
+    return ImportResult(path, mtime, sample.digest, sample.frames, rate, analyse(sample.data, rate),
+                        sample.data if sample.nbytes <= MAX_TRANSFER else None)
+
+
+def probe_batch(paths: List[str], rate: int, channels: int, quality: str) -> List[ImportResult]:
+    return [probe(path, rate, channels, quality) for path in paths]
+
+
+class BulkImport:
+    # fans files out over a process pool. the gui polls progress and drains results, nothing here calls back into tk
+
+    def __init__(self, paths: List[str], rate: int = 44100, channels: int = 2, quality: str = QUALITY_FAST,
+                 workers: int | None = None):
+        self.paths = paths
+        self.rate = rate
+        self.channels = channels
+        self.quality = quality
+        self.workers = workers
+
+        self.total: int = len(paths)
+        self.done: int = 0
+        self.failed: int = 0
+        self.cancelled: bool = False
+
+        self._lock = threading.Lock()
+        self._results: List[ImportResult] = []
+        self._pending: int = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.cancelled or self.done >= self.total
+
+    def start(self) -> None:
+        if not self.paths:
+            return
+
+        batches = [self.paths[i:i + BATCH] for i in range(0, len(self.paths), BATCH)]
+        # counted up front, an early batch can finish before the last one is submitted
+        self._pending = len(batches)
+        # spawned, not forked: a fork would copy the audio, hotkey and tk threads' state into every worker
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        for batch in batches:
+            future = self._executor.submit(probe_batch, batch, self.rate, self.channels, self.quality)
+            future.add_done_callback(partial(self._completed, batch))
+
+    def _completed(self, batch: List[str], future: Future) -> None:
+        if future.cancelled():
+            return
+        try:
+            results = future.result()
+        except Exception as e:
+            # a crashed worker takes its whole batch with it
+            traceback.print_exc()
+            results = [ImportResult(path, error=str(e) or type(e).__name__) for path in batch]
+
+        with self._lock:
+            self._results.extend(results)
+            self.done += len(results)
+            self.failed += sum(not result.ok for result in results)
+            self._pending -= 1
+            last = self._pending == 0
+        if last:
+            self.shutdown()
+
+    def drain(self) -> List[ImportResult]:
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
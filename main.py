@@ -1,21 +1,38 @@
 from __future__ import annotations
 
-import pyaudio
+import sys
+from startup import StartupProfile
+# started before the rest of the imports so they're counted too
+profile = StartupProfile("--profile-startup" in sys.argv)
+
 import tkinter as tk
 from tkinter import ttk
 from tkinter import font
-from tkinter import messagebox
-import wave
 import re
-from typing import Mapping, List, Any
-import pickle
+import traceback
+from typing import TYPE_CHECKING, List
 from event import Event
+from backends import DeviceParameters, PyAudioBackend
+# pickles written before board.py existed reference __main__.AppInfo/SoundSpec, so keep them importable from here
+from board import AppInfo, SoundSpec, Soundboard
+from engine import AudioEngine
+from mixer import LIMIT_CLIP, LIMIT_SOFT
+from convert import QUALITY_BEST, QUALITY_FAST
+from dsp import COMPRESSOR, GATE, HIGHPASS, LIMITER
+from peaks import PEAK_DIRECTORY, Peaks
+from search import BUILD_SLICE
+from wavmap import WaveFormatError
+from stats import StatsDumper
+from store import AppInfoStore
+
+if TYPE_CHECKING:
+    from pynput import keyboard
 
-import numpy as np
-from pynput import keyboard
+    from importer import BulkImport
 
+profile.mark("imports")
 
-DeviceParameters = Mapping[str, str | int | float]
+NO_DEVICE: DeviceParameters = {"index": -1, "name": "", "maxInputChannels": 0, "maxOutputChannels": 0}
 
 
 def bind(f, *args, **kwargs):
@@ -25,54 +42,72 @@ def bind(f, *args, **kwargs):
     return bound
 
 
-# def mix(a: bytes, b: bytes) -> bytes:
-#     return ((np.frombuffer(a, dtype=np.int16) + np.frombuffer(b, dtype=np.int16)) // 2).tobytes()
+def format_sequence(sequence: List[list], sounds: List[SoundSpec]) -> str:
+    names = {spec.id: spec.name for spec in sounds}
+    return ", ".join(f"{names[spec_id]} @ {ms}" for spec_id, ms in sequence if spec_id in names)
 
 
-def mix(a: bytes, b: bytes, volume_a: float = 1, volume_b: float = 1) -> bytes:
-    return ((np.frombuffer(a, dtype=np.int16) * volume_a + np.frombuffer(b, dtype=np.int16) * volume_b) // 2).astype(np.int16).tobytes()
+def parse_sequence(text: str, sounds: List[SoundSpec]) -> List[list]:
+    # "name @ ms, name @ ms", the ms being from when this sound starts
+    sequence = []
+    for step in filter(None, map(str.strip, text.split(","))):
+        name, _, ms = step.rpartition("@")
+        spec = next((spec for spec in sounds if spec.name == name.strip()), None)
+        if spec is None:
+            raise ValueError(f"No sound called {name.strip() or step}.")
+        sequence.append([spec.id, int(ms)])
+    return sequence
 
 
 def get_device_by_name(name: str, devices: List[DeviceParameters]) -> DeviceParameters:
-    return next((device for device in devices if device["name"] == name), devices[0])
-
-
-class SoundSpec:
-    def __init__(self):
-        self.name: str = "Sound"
-        self.path: str = ""
-        self.volume: float = 1
-        self.keys: set[keyboard.Key] = set()
-
-
-class AppInfo:
-    VERSION: float = 0.2
-
-    def __init__(self):
-        self.version: float = self.VERSION
-        self.sounds: List[SoundSpec] = []
-        self.echo: bool = True
-        self.input_device_name = ""
-        self.output_device_name = ""
-        self.echo_device_name = ""
-
-    def dumps(self) -> bytes:
-        return pickle.dumps(self)
-
-    @staticmethod
-    def loads(serialised: bytes) -> AppInfo:
-        return pickle.loads(serialised)
+    return next((device for device in devices if device["name"] == name), devices[0] if devices else NO_DEVICE)
+
+
+class Waveform(tk.Canvas):
+    # a peak preview plus a line per playing voice. one polygon however long the sound, so it's cheap to redraw
+
+    def __init__(self, master, width: int, height: int, *args, **kwargs):
+        super().__init__(master, *args, width=width, height=height, highlightthickness=0, background="white",
+                         **kwargs)
+        self.width = width
+        self.height = height
+        self.peaks: Peaks | None = None
+        self.shape = self.create_polygon(0, 0, 0, 0, fill="#7a9cc6", outline="")
+        # line items, kept hidden rather than deleted when fewer voices are playing
+        self.playheads: List[int] = []
+
+    def set_peaks(self, peaks: Peaks | None) -> None:
+        self.peaks = peaks
+        self.coords(self.shape, *(peaks.outline(self.width, self.height) if peaks is not None else (0, 0, 0, 0)))
+        self.set_playheads([])
+
+    def set_playheads(self, positions: List[int]) -> None:
+        if self.peaks is None or not self.peaks.frames:
+            positions = []
+        while len(self.playheads) < len(positions):
+            self.playheads.append(self.create_line(0, 0, 0, self.height, fill="red"))
+        for i, item in enumerate(self.playheads):
+            if i < len(positions):
+                x = min(positions[i] / self.peaks.frames, 1) * (self.width - 1)
+                self.coords(item, x, 0, x, self.height)
+                self.itemconfigure(item, state="normal")
+            else:
+                self.itemconfigure(item, state="hidden")
 
 
 class SoundEditor(tk.Toplevel):
     _styles_initialised: bool = False
     ErrorStyleName = "Error.TLabel"
+    WAVEFORM_WIDTH: int = 300
+    WAVEFORM_HEIGHT: int = 60
 
     def __init__(self, master: SoundboardApp, spec: SoundSpec, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
 
         self.app = master
         self.spec = spec
+        # what Test plays, the same one each time so it can be stopped
+        self.test_spec = SoundSpec()
 
         if not self._styles_initialised:
             self.init_styles()
@@ -94,12 +129,43 @@ class SoundEditor(tk.Toplevel):
         self.path_entry = ttk.Entry(self.frame, textvariable=self.path_var)
         self.path_entry.grid()
 
+        self.waveform = Waveform(self.frame, self.WAVEFORM_WIDTH, self.WAVEFORM_HEIGHT)
+        self.waveform.grid(pady=(5, 0))
+        self.length_label = ttk.Label(self.frame, text="")
+        self.length_label.grid()
+        self.show_peaks()
+
         self.volume_label = ttk.Label(self.frame, text="Volume")
         self.volume_label.grid()
         self.volume_var = tk.DoubleVar(value=self.spec.volume)
         self.volume_slider = ttk.Scale(self.frame, variable=self.volume_var)
         self.volume_slider.grid()
 
+        self.loops_label = ttk.Label(self.frame, text="Loops (0 repeats until pressed again)")
+        self.loops_label.grid()
+        self.loops_var = tk.IntVar(value=self.spec.loops)
+        self.loops_spinbox = ttk.Spinbox(self.frame, from_=0, to=999, textvariable=self.loops_var)
+        self.loops_spinbox.grid()
+
+        self.crossfade_label = ttk.Label(self.frame, text="Crossfade (ms)")
+        self.crossfade_label.grid()
+        self.crossfade_var = tk.IntVar(value=self.spec.crossfade_ms)
+        self.crossfade_spinbox = ttk.Spinbox(self.frame, from_=0, to=5000, increment=10,
+                                             textvariable=self.crossfade_var)
+        self.crossfade_spinbox.grid()
+
+        self.delay_label = ttk.Label(self.frame, text="Delay (ms)")
+        self.delay_label.grid()
+        self.delay_var = tk.IntVar(value=self.spec.delay_ms)
+        self.delay_spinbox = ttk.Spinbox(self.frame, from_=0, to=60000, increment=50, textvariable=self.delay_var)
+        self.delay_spinbox.grid()
+
+        self.sequence_label = ttk.Label(self.frame, text="Then Play (name @ ms, ...)")
+        self.sequence_label.grid()
+        self.sequence_var = tk.StringVar(value=format_sequence(self.spec.sequence, self.app.appinfo.sounds))
+        self.sequence_entry = ttk.Entry(self.frame, textvariable=self.sequence_var)
+        self.sequence_entry.grid()
+
         self.key_frame = ttk.Frame(self.frame)
         self.key_frame.grid()
 
@@ -130,34 +196,74 @@ class SoundEditor(tk.Toplevel):
         s = ttk.Style()
         s.configure(self.ErrorStyleName, foreground="red")
 
+    def show_peaks(self) -> None:
+        path = self.spec.path
+        peaks = self.app.board.peaks.get(path) if path else None
+        if peaks is None and path:
+            self.app.when_done(self.app.board.peaks.request(path), lambda future: self.peaks_ready(path, future))
+        self.set_peaks(peaks)
+
+    def peaks_ready(self, path: str, future) -> None:
+        # the window may be gone, or pointed at another file, by the time it's built
+        if future.exception() is None and self.winfo_exists() and self.spec.path == path:
+            self.set_peaks(future.result())
+
+    def set_peaks(self, peaks: Peaks | None) -> None:
+        self.waveform.set_peaks(peaks)
+        self.length_label.configure(text=f"{peaks.duration:.2f} s" if peaks is not None else "")
+
     def stringify_keys(self):
         return " ".join(map(str, self.spec.keys))
 
     def on_close(self) -> None:
+        self.app.board.stop_sound(self.test_spec)
         self.app.editors.remove(self)
         self.destroy()
 
     def apply_to_spec(self, spec: SoundSpec) -> None:
+        # anything that can fail goes first so a bad entry leaves the spec untouched
+        sequence = parse_sequence(self.sequence_var.get(), self.app.appinfo.sounds)
+        loops, crossfade_ms, delay_ms = self.loops_var.get(), self.crossfade_var.get(), self.delay_var.get()
         spec.name = self.name_var.get()
         spec.path = self.path_var.get()
         spec.volume = self.volume_var.get()
+        spec.loops = max(0, loops)
+        spec.crossfade_ms = max(0, crossfade_ms)
+        spec.delay_ms = max(0, delay_ms)
+        spec.sequence = sequence
 
     def test(self) -> None:
-        test_spec = SoundSpec()
-        self.apply_to_spec(test_spec)
+        # the last test goes first, a forever loop on a spec nothing else can trigger would never stop
+        self.app.board.stop_sound(self.test_spec)
         try:
-            self.app.play_sound(test_spec)
+            self.apply_to_spec(self.test_spec)
+            self.app.play_sound(self.test_spec)
         except FileNotFoundError:
             self.error.config(text="File not found.")
+        except WaveFormatError:
+            self.error.config(text="Unsupported file.")
+        except (ValueError, tk.TclError) as error:
+            self.error.config(text=str(error))
 
     def apply(self) -> None:
         # self.spec.name = self.name_var.get()
         # self.spec.path = self.path_var.get()
         # self.spec.volume = self.volume_var.get()
-        self.apply_to_spec(self.spec)
-
-        self.app.thumbnails.get_thumbnail_by_spec(self.spec).spec_updated()
-        self.app.save_appinfo()
+        try:
+            self.apply_to_spec(self.spec)
+        except (ValueError, tk.TclError) as error:
+            self.error.config(text=str(error))
+            return
+        self.error.config(text="")
+        self.app.sample_cache.preload_async([self.spec.path])
+        self.show_peaks()
+        self.app.hotkeys.update(self.spec)
+        self.app.search.update(self.spec)
+        if self.app.engine is not None:
+            self.app.engine.set_volume(self.spec, self.spec.volume)
+
+        self.app.thumbnails.spec_updated(self.spec)
+        self.app.store.save_spec(self.spec)
 
         self.title("Shiteboard - " + self.spec.name)
 
@@ -173,6 +279,8 @@ class SoundEditor(tk.Toplevel):
             self.app.released.remove(on_released)
 
             self.spec.keys = keys
+            self.app.hotkeys.update(self.spec)
+            self.app.store.save_spec(self.spec)
 
             self.key_label.configure(text=self.stringify_keys())
 
@@ -181,13 +289,15 @@ class SoundEditor(tk.Toplevel):
 
 
 class SoundThumbnail(ttk.Frame):
+    WAVEFORM_WIDTH: int = 128
+    WAVEFORM_HEIGHT: int = 16
     _styles_initialised = False
     StyleName = "ThumbnailStyle.TFrame"
     HoverStyleName = "ThumbnailHover.TFrame"
     LabelStyleName = "ThumbnailStyle.TLabel"
     LabelHoverStyleName = "ThumbnailHover.TLabel"
 
-    def __init__(self, master, spec: SoundSpec, *args, **kwargs):
+    def __init__(self, master, spec: SoundSpec | None = None, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
 
         if not self._styles_initialised:
@@ -201,18 +311,35 @@ class SoundThumbnail(ttk.Frame):
         self.bind("<Enter>", self.on_enter)
         self.bind("<Leave>", self.on_exit)
 
-        self.spec: SoundSpec = spec
+        # thumbnails are pooled and rebound to whichever spec scrolls into their cell
+        self.spec: SoundSpec | None = None
+        # the canvas window item this thumbnail lives in
+        self.window: int | None = None
+        self.selected: bool = False
+        self.hovered: bool = False
 
         self.label = ttk.Label(self)
         self.label.bind("<Button-1>", self.clicked.bind_invoke_empty(self, None))
         self.label.configure(style=self.LabelStyleName)
-        self.label.grid()
+        self.label.grid(sticky="w")
+
+        self.waveform = Waveform(self, self.WAVEFORM_WIDTH, self.WAVEFORM_HEIGHT)
+        self.waveform.bind("<Button-1>", self.clicked.bind_invoke_empty(self, None))
+        self.waveform.grid()
+
+        if spec is not None:
+            self.set_spec(spec)
 
+    def set_spec(self, spec: SoundSpec) -> None:
+        self.spec = spec
         self.spec_updated()
 
     def spec_updated(self):
         self.label.configure(text=self.spec.name)
 
+    def set_peaks(self, peaks: Peaks | None) -> None:
+        self.waveform.set_peaks(peaks)
+
     def init_styles(self):
         style = ttk.Style()
         style.configure(self.StyleName, background="white")
@@ -222,23 +349,67 @@ class SoundThumbnail(ttk.Frame):
 
         self._styles_initialised = True
 
+    def update_style(self) -> None:
+        if self.hovered or self.selected:
+            self.configure(style=self.HoverStyleName)
+            self.label.configure(style=self.LabelHoverStyleName)
+            self.waveform.configure(background="#e0eef9")
+        else:
+            self.configure(style=self.StyleName)
+            self.label.configure(style=self.LabelStyleName)
+            self.waveform.configure(background="white")
+
+    def set_selected(self, selected: bool) -> None:
+        if selected != self.selected:
+            self.selected = selected
+            self.update_style()
+
     def on_enter(self, value):
-        self.configure(style=self.HoverStyleName)
-        self.label.configure(style=self.LabelHoverStyleName)
+        self.hovered = True
+        self.update_style()
 
     def on_exit(self, value):
-        self.configure(style=self.StyleName)
-        self.label.configure(style=self.LabelStyleName)
+        self.hovered = False
+        self.update_style()
 
 
 class Thumbnails(ttk.Frame):
+    # virtualised grid: only cells inside the viewport have widgets, and those are recycled as it scrolls
+    CELL_WIDTH: int = 150
+    CELL_HEIGHT: int = 56
+    CELL_PAD: int = 5
+    VISIBLE_ROWS: int = 8
+    # removals position() may have to walk back over before what's after them gets renumbered
+    MAX_STALE: int = 32
+
     def __init__(self, master: SoundboardApp, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
 
         self.app = master
 
+        self.thumbnails_columns = 4
+
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.filter())
+        self.search_entry = ttk.Entry(self, textvariable=self.search_var)
+        self.search_entry.grid(sticky="we", pady=(0, 5))
+        self.search_entry.bind("<Down>", lambda event: self.move_selection(1))
+        self.search_entry.bind("<Up>", lambda event: self.move_selection(-1))
+        self.search_entry.bind("<Return>", lambda event: self.play_selected())
+        self.search_entry.bind("<Escape>", lambda event: self.search_var.set(""))
+
         self.thumbnail_frame = ttk.Frame(self)
         self.thumbnail_frame.grid()
+        self.canvas = tk.Canvas(self.thumbnail_frame, width=self.thumbnails_columns * self.CELL_WIDTH,
+                                height=self.VISIBLE_ROWS * self.CELL_HEIGHT, yscrollincrement=self.CELL_HEIGHT,
+                                highlightthickness=0)
+        self.canvas.grid(row=0, column=0)
+        self.scrollbar = ttk.Scrollbar(self.thumbnail_frame, orient="vertical", command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.bind_wheel(self.canvas)
+
         # self.add_sound_frame = ttk.Frame(self.thumbnail_frame)
         # self.add_sound_frame.grid()
         self.buttons_frame = ttk.Frame(self)
@@ -247,61 +418,308 @@ class Thumbnails(ttk.Frame):
         self.clear_sounds_button.grid(row=0, column=0)
         self.add_sound_button = ttk.Button(self.buttons_frame, text="+", command=self.add_sound)
         self.add_sound_button.grid(row=0, column=1)
+        self.import_button = ttk.Button(self.buttons_frame, text="📁", command=self.import_folder)
+        self.import_button.grid(row=0, column=2)
+        self.stop_button = ttk.Button(self.buttons_frame, text="⏹", command=lambda: self.app.board.stop_all())
+        self.stop_button.grid(row=0, column=3)
+        self.replay_button = ttk.Button(self.buttons_frame, text="⏺", command=lambda: self.app.save_replay())
+        self.replay_button.grid(row=0, column=4)
+
+        # what the grid shows, in order, and where each spec sits in it. removals don't renumber what's after them
+        # straight away, so a position can be too high by up to _stale and position() walks back that far. once
+        # there are MAX_STALE of them everything from the first one on is renumbered in one go. the visible pass
+        # stamps the exact position on everything in view
+        self.specs: List[SoundSpec] = []
+        self.index: dict[SoundSpec, int] = {}
+        self._stale: int = 0
+        self._stale_from: int = 0
+        self.query: str = ""
+        # cell picked with the arrow keys while searching, the top hit to begin with
+        self.selected: int | None = None
+        # cell -> thumbnail for the cells currently in view, the rest wait in the pool
+        self.visible: dict[int, SoundThumbnail] = {}
+        self.pool: List[SoundThumbnail] = []
+        # the ones with playheads drawn last frame
+        self.playing: set[SoundThumbnail] = set()
+        self._refresh_pending: bool = False
+        self._refilter_pending: bool = False
 
-        self.thumbnails_columns = 4
-        for c in range(self.thumbnails_columns):
-            self.thumbnail_frame.columnconfigure(c, pad=5)
-
-        self.thumbnails: List[SoundThumbnail] = []
         self.create_sound_table()
 
-    def clear_thumbnails(self):
-        for thumbnail in self.thumbnails:
-            thumbnail.destroy()
+    def bind_wheel(self, widget: tk.Widget) -> None:
+        widget.bind("<MouseWheel>", self.on_wheel)
+        # x11 sends the wheel as buttons
+        widget.bind("<Button-4>", self.on_wheel)
+        widget.bind("<Button-5>", self.on_wheel)
+
+    def on_wheel(self, event) -> None:
+        self.canvas.yview_scroll(-1 if event.num == 4 or event.delta > 0 else 1, "units")
+        self.refresh()
+
+    def yview(self, *args) -> None:
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def schedule_refresh(self, refilter: bool = False) -> None:
+        # coalesces a burst of adds (e.g. a bulk import) into one layout pass
+        self._refilter_pending |= refilter
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.after_idle(self.refresh)
+
+    def refresh(self) -> None:
+        self._refresh_pending = False
+        if self._refilter_pending:
+            self._refilter_pending = False
+            self.filter()  # comes back through here
+            return
+
+        columns = self.thumbnails_columns
+        rows = (len(self.specs) + columns - 1) // columns
+        height = max(self.canvas.winfo_height(), self.VISIBLE_ROWS * self.CELL_HEIGHT)
+        self.canvas.configure(scrollregion=(0, 0, columns * self.CELL_WIDTH, max(rows * self.CELL_HEIGHT, height)))
+
+        top = int(self.canvas.canvasy(0))
+        first = top // self.CELL_HEIGHT * columns
+        last = min(len(self.specs), ((top + height) // self.CELL_HEIGHT + 1) * columns)
+
+        for cell in [cell for cell in self.visible if not first <= cell < last]:
+            thumbnail = self.visible.pop(cell)
+            self.canvas.itemconfigure(thumbnail.window, state="hidden")
+            self.pool.append(thumbnail)
+
+        for cell in range(first, last):
+            spec = self.specs[cell]
+            self.index[spec] = cell
+            thumbnail = self.visible.get(cell)
+            if thumbnail is None:
+                thumbnail = self.pool.pop() if self.pool else self.create_thumbnail()
+                self.visible[cell] = thumbnail
+                r, c = divmod(cell, columns)
+                self.canvas.coords(thumbnail.window, c * self.CELL_WIDTH, r * self.CELL_HEIGHT)
+                self.canvas.itemconfigure(thumbnail.window, state="normal")
+                self.set_spec(thumbnail, spec)
+            elif thumbnail.spec is not spec:
+                # cells shifted under it after a removal
+                self.set_spec(thumbnail, spec)
+            thumbnail.set_selected(cell == self.selected)
+
+    def set_spec(self, thumbnail: SoundThumbnail, spec: SoundSpec) -> None:
+        thumbnail.set_spec(spec)
+        self.show_peaks(thumbnail)
+
+    def show_peaks(self, thumbnail: SoundThumbnail) -> None:
+        # from the peak cache, which only stats the file. anything not in it yet is built in the background and
+        # drawn when it's done, if the thumbnail is still showing the same sound by then
+        spec = thumbnail.spec
+        peaks = self.app.board.peaks.get(spec.path) if spec.path else None
+        if peaks is None and spec.path:
+            self.app.when_done(self.app.board.peaks.request(spec.path),
+                               lambda future: self.peaks_ready(thumbnail, spec, future))
+        thumbnail.set_peaks(peaks)
+
+    def peaks_ready(self, thumbnail: SoundThumbnail, spec: SoundSpec, future) -> None:
+        if future.exception() is None and thumbnail.spec is spec:
+            thumbnail.set_peaks(future.result())
+
+    def show_playheads(self, playheads: dict[SoundSpec, List[int]]) -> None:
+        playing = set()
+        for spec, positions in playheads.items():
+            thumbnail = self.visible.get(self.position(spec))
+            if thumbnail is not None:
+                thumbnail.waveform.set_playheads(positions)
+                playing.add(thumbnail)
+        for thumbnail in self.playing - playing:
+            thumbnail.waveform.set_playheads([])
+        self.playing = playing
+
+    def create_thumbnail(self) -> SoundThumbnail:
+        thumbnail = SoundThumbnail(self.canvas)
+        thumbnail.clicked.add(self.edit_sound)
+        self.bind_wheel(thumbnail)
+        self.bind_wheel(thumbnail.label)
+        self.bind_wheel(thumbnail.waveform)
+        thumbnail.window = self.canvas.create_window(0, 0, window=thumbnail, anchor="nw",
+                                                     width=self.CELL_WIDTH - self.CELL_PAD,
+                                                     height=self.CELL_HEIGHT - self.CELL_PAD)
+        return thumbnail
+
+    def show(self, specs: List[SoundSpec]) -> None:
+        self.specs = list(specs)
+        self.index = {spec: i for i, spec in enumerate(self.specs)}
+        self._stale = 0
+        self.selected = 0 if self.query and self.specs else None
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def filter(self) -> None:
+        self.query = self.search_var.get().strip()
+        self.show(self.app.search.search(self.query) if self.query else self.app.appinfo.sounds)
+
+    def move_selection(self, step: int) -> str:
+        if self.selected is None:
+            return "break"
+        self.selected = max(0, min(len(self.specs) - 1, self.selected + step))
+
+        # keep it in view
+        row = self.selected // self.thumbnails_columns
+        top = int(self.canvas.canvasy(0)) // self.CELL_HEIGHT
+        rows = max(1, self.canvas.winfo_height() // self.CELL_HEIGHT)
+        if not top <= row < top + rows:
+            self.canvas.yview_scroll(row - top if row < top else row - top - rows + 1, "units")
+        self.refresh()
+        return "break"
+
+    def play_selected(self) -> str:
+        if self.selected is not None:
+            try:
+                self.app.play_sound(self.specs[self.selected])
+            except (OSError, WaveFormatError):
+                self.bell()
+        return "break"
 
-        self.thumbnails = []
+    def clear_thumbnails(self):
+        self.specs = []
+        self.index = {}
+        self._stale = 0
+        self.selected = None
+        self.refresh()
+
+    def position(self, spec: SoundSpec) -> int | None:
+        i = self.index.get(spec)
+        if i is None:
+            return None
+        i = min(i, len(self.specs) - 1)
+        while self.specs[i] is not spec:
+            i -= 1
+        return i
 
     def remove_thumbnail(self, spec: SoundSpec):
-        # inefficient but im lazy
-        # to improve find index first and del
-        thumbnail = self.get_thumbnail_by_spec(spec)
-        thumbnail.destroy()
-        self.thumbnails.remove(thumbnail)
-
-    def get_thumbnail_by_spec(self, spec: SoundSpec) -> SoundThumbnail:
-        return next(thumbnail for thumbnail in self.thumbnails if thumbnail.spec == spec)
+        i = self.position(spec)
+        if i is None:
+            return  # filtered out
+        del self.specs[i]
+        del self.index[spec]
+        self._stale_from = min(self._stale_from, i) if self._stale else i
+        self._stale += 1
+        if self._stale >= self.MAX_STALE:
+            for j in range(self._stale_from, len(self.specs)):
+                self.index[self.specs[j]] = j
+            self._stale = 0
+        if self.selected is not None and self.selected >= len(self.specs):
+            self.selected = len(self.specs) - 1 if self.specs else None
+        self.refresh()
+
+    def spec_updated(self, spec: SoundSpec) -> None:
+        if self.query:
+            # a rename can move it in or out of the results
+            self.filter()
+            return
+        thumbnail = self.visible.get(self.position(spec))
+        if thumbnail is not None:
+            thumbnail.spec_updated()
+            # the path may have changed
+            self.show_peaks(thumbnail)
 
     def create_sound_table(self) -> None:
-        self.clear_thumbnails()
-
-        for spec in self.app.appinfo.sounds:
-            self.add_thumbnail(spec)
+        self.show(self.app.appinfo.sounds)
 
     def add_sound(self) -> None:
         spec = SoundSpec()
         self.app.appinfo.sounds.append(spec)
-        self.app.save_appinfo()
+        self.app.search.add(spec)
+        self.app.store.save_spec(spec)
         self.add_thumbnail(spec)
 
-    def add_thumbnail(self, spec) -> None:
-        thumbnail = SoundThumbnail(self.thumbnail_frame, spec)
-        thumbnail.clicked.add(self.edit_sound)
+    def import_folder(self) -> None:
+        from tkinter import filedialog
+
+        root = filedialog.askdirectory(parent=self, title="Import Sounds", mustexist=True)
+        if root:
+            ImportDialog(self.app, self.app.board.import_folder(root))
 
-        i = len(self.thumbnails)
-        r = i // self.thumbnails_columns
-        thumbnail.grid(row=r, column=i % self.thumbnails_columns)
-        self.thumbnail_frame.rowconfigure(r, pad=5)
-        self.thumbnails.append(thumbnail)
+    def add_thumbnail(self, spec) -> None:
+        if self.query:
+            self.schedule_refresh(refilter=True)
+            return
+        self.index[spec] = len(self.specs)
+        self.specs.append(spec)
+        self.schedule_refresh()
 
     def edit_sound(self, sender: SoundThumbnail, args) -> None:
         self.app.add_editor(sender.spec)
 
     def clear_sounds(self) -> None:
+        from tkinter import messagebox
+
         ok = messagebox.askokcancel("Clear Sounds", "Are you sure you want to clear the soundboard?")
         if ok:
+            self.app.board.stop_all()
             self.clear_thumbnails()
             self.app.appinfo.sounds = []
-            self.app.save_appinfo()
+            self.app.hotkeys.rebuild(self.app.appinfo.sounds)
+            self.app.search.rebuild(self.app.appinfo.sounds)
+            self.app.store.clear_specs()
+
+
+class ImportDialog(tk.Toplevel):
+    POLL: int = 100
+
+    def __init__(self, master: SoundboardApp, bulk: BulkImport, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        self.app = master
+        self.bulk = bulk
+
+        self.title("Shiteboard - Import")
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        self.frame = ttk.Frame(self, padding=10)
+        self.frame.grid()
+        self.progress = ttk.Progressbar(self.frame, length=300, maximum=max(1, bulk.total))
+        self.progress.grid()
+        self.status_label = ttk.Label(self.frame)
+        self.status_label.grid()
+        self.cancel_button = ttk.Button(self.frame, text="Cancel", command=self.cancel)
+        self.cancel_button.grid()
+
+        self.imported: int = 0
+        self._after: str | None = None
+        self.poll()
+
+    def add_results(self) -> None:
+        for spec in self.app.board.add_imported(self.bulk.drain()):
+            self.app.thumbnails.add_thumbnail(spec)
+            self.app.store.save_spec(spec)
+            self.imported += 1
+
+    def poll(self) -> None:
+        # results are added in whatever batches have finished since the last poll, the tk loop never waits
+        self.add_results()
+
+        self.progress.configure(value=self.bulk.done)
+        status = f"{self.bulk.done} / {self.bulk.total} files, {self.imported} imported"
+        if self.bulk.failed:
+            status += f", {self.bulk.failed} failed"
+        self.status_label.configure(text=status)
+
+        if self.bulk.finished:
+            self._after = None
+            self.cancel_button.configure(text="Close", command=self.destroy)
+        else:
+            self._after = self.after(self.POLL, self.poll)
+
+    def cancel(self) -> None:
+        self.bulk.cancel()
+        # keep whatever already finished
+        self.add_results()
+        self.destroy()
+
+    def destroy(self) -> None:
+        if self._after is not None:
+            self.after_cancel(self._after)
+            self._after = None
+        super().destroy()
 
 
 class Settings(ttk.Frame):
@@ -335,38 +753,222 @@ class Settings(ttk.Frame):
                                                *map(lambda x: x["name"], self.app.output_devices),
                                                command=self.echo_device_changed)
         self.echo_device_menu.grid()
+        self.echo_latency_label = ttk.Label(self, text="Echo Latency (ms)")
+        self.echo_latency_label.grid()
+        self.echo_latency_var = tk.IntVar(value=self.app.appinfo.echo_latency_ms)
+        self.echo_latency_spinbox = ttk.Spinbox(self, from_=10, to=500, increment=10,
+                                                textvariable=self.echo_latency_var,
+                                                command=self.echo_latency_changed)
+        self.echo_latency_spinbox.grid()
+
+        self.max_voices_label = ttk.Label(self, text="Max Voices")
+        self.max_voices_label.grid()
+        self.max_voices_var = tk.IntVar(value=self.app.appinfo.max_voices)
+        self.max_voices_spinbox = ttk.Spinbox(self, from_=1, to=64, textvariable=self.max_voices_var,
+                                              command=self.max_voices_changed)
+        self.max_voices_spinbox.grid()
+
+        self.limiter_label = ttk.Label(self, text="Limiter")
+        self.limiter_label.grid()
+        self.limiter_menu = ttk.OptionMenu(self, tk.StringVar(), self.app.appinfo.limiter, LIMIT_SOFT, LIMIT_CLIP,
+                                           command=self.limiter_changed)
+        self.limiter_menu.grid()
+
+        self.quality_label = ttk.Label(self, text="Resample Quality")
+        self.quality_label.grid()
+        self.quality_menu = ttk.OptionMenu(self, tk.StringVar(), self.app.appinfo.resample_quality,
+                                           QUALITY_FAST, QUALITY_BEST, command=self.quality_changed)
+        self.quality_menu.grid()
+
+        self.normalize_var = tk.BooleanVar(value=self.app.appinfo.normalize)
+        self.normalize_checkbox = ttk.Checkbutton(self, text="Normalise Loudness", variable=self.normalize_var,
+                                                  command=self.normalize_changed)
+        self.normalize_checkbox.grid()
+        self.trim_silence_var = tk.BooleanVar(value=self.app.appinfo.trim_silence)
+        self.trim_silence_checkbox = ttk.Checkbutton(self, text="Trim Silence", variable=self.trim_silence_var,
+                                                     command=self.trim_silence_changed)
+        self.trim_silence_checkbox.grid()
+
+        self.effects_label = ttk.Label(self, text="Mic Effects")
+        self.effects_label.grid()
+        self.effect_vars: dict[str, tk.BooleanVar] = {}
+        for name, text in ((HIGHPASS, "High-pass"), (GATE, "Noise Gate"), (COMPRESSOR, "Compressor"),
+                           (LIMITER, "Mic Limiter")):
+            var = self.effect_vars[name] = tk.BooleanVar(value=self.app.appinfo.mic_effects.get(name, False))
+            ttk.Checkbutton(self, text=text, variable=var, command=bind(self.effect_changed, name)).grid()
+
+        self.replay_label = ttk.Label(self, text="Replay Length (s)")
+        self.replay_label.grid()
+        self.replay_var = tk.IntVar(value=self.app.appinfo.replay_seconds)
+        self.replay_spinbox = ttk.Spinbox(self, from_=10, to=300, increment=10, textvariable=self.replay_var,
+                                          command=self.replay_seconds_changed)
+        self.replay_spinbox.grid()
+        self.replay_to_board_var = tk.BooleanVar(value=self.app.appinfo.replay_to_board)
+        self.replay_to_board_checkbox = ttk.Checkbutton(self, text="Add Replays To Board",
+                                                        variable=self.replay_to_board_var,
+                                                        command=self.replay_to_board_changed)
+        self.replay_to_board_checkbox.grid()
+
+        self.adaptive_var = tk.BooleanVar(value=self.app.appinfo.adaptive_chunk)
+        self.adaptive_checkbox = ttk.Checkbutton(self, text="Adaptive Buffer Size", variable=self.adaptive_var,
+                                                 command=self.adaptive_changed)
+        self.adaptive_checkbox.grid()
+
+        self.show_stats_var = tk.BooleanVar(value=self.app.appinfo.show_stats)
+        self.show_stats_checkbox = ttk.Checkbutton(self, text="Show Stats", variable=self.show_stats_var,
+                                                   command=self.show_stats_changed)
+        self.show_stats_checkbox.grid()
+
+    def set_enabled(self, enabled: bool) -> None:
+        for child in self.winfo_children():
+            if isinstance(child, ttk.Widget):
+                child.state(["!disabled"] if enabled else ["disabled"])
+
+    def set_devices_enabled(self, enabled: bool) -> None:
+        # just the device menus, all there is to change while no devices are open
+        for menu in (self.input_device_menu, self.output_device_menu, self.echo_device_menu):
+            menu.state(["!disabled"] if enabled else ["disabled"])
 
     def input_device_changed(self, value: str) -> None:
+        # opened and warmed up in the background, the old device keeps playing until the new one is ready
         self.app.set_input_device(get_device_by_name(value, self.app.input_devices))
-        self.app.input_stream.close()
-        self.app.input_stream = self.app.get_stream(input=True, input_device_index=self.app.input_device["index"])
-        self.app.save_appinfo()
+        self.app.swap_device(self.app.board.devices.swap_input, self.app.input_device["index"])
+        self.app.save_settings()
 
     def output_device_changed(self, value: str) -> None:
         self.app.set_output_device(get_device_by_name(value, self.app.output_devices))
-        self.app.output_stream.close()
-        self.app.output_stream = self.app.get_stream(output=True, output_device_index=self.app.output_device["index"])
-        self.app.save_appinfo()
+        self.app.swap_device(self.app.board.devices.swap_output, self.app.output_device["index"])
+        self.app.save_settings()
 
     def echo_device_changed(self, value: str) -> None:
         self.app.set_echo_device(get_device_by_name(value, self.app.output_devices))
-        self.app.echo_stream.close()
-        self.app.echo_stream = self.app.get_stream(output=True, output_device_index=self.app.echo_device["index"])
-        self.app.save_appinfo()
+        self.app.swap_device(self.app.board.devices.swap_echo, self.app.echo_device["index"])
+        self.app.save_settings()
+
+    def update_devices(self) -> None:
+        self.input_device_menu.set_menu(self.app.input_device["name"],
+                                        *map(lambda x: x["name"], self.app.input_devices))
+        self.output_device_menu.set_menu(self.app.output_device["name"],
+                                         *map(lambda x: x["name"], self.app.output_devices))
+        self.echo_device_menu.set_menu(self.app.echo_device["name"],
+                                       *map(lambda x: x["name"], self.app.output_devices))
+
+    def echo_latency_changed(self) -> None:
+        self.app.appinfo.echo_latency_ms = self.echo_latency_var.get()
+        self.app.engine.set_echo_latency(self.app.appinfo.echo_latency_ms / 1000)
+        self.app.save_settings()
 
     def echo_enabled_changed(self) -> None:
         self.app.appinfo.echo = self.echo_var.get()
-        self.app.save_appinfo()
+        self.app.engine.echo = self.app.appinfo.echo
+        self.app.save_settings()
+
+    def max_voices_changed(self) -> None:
+        self.app.appinfo.max_voices = self.max_voices_var.get()
+        self.app.engine.set_max_voices(self.app.appinfo.max_voices)
+        self.app.save_settings()
+
+    def limiter_changed(self, value: str) -> None:
+        self.app.appinfo.limiter = value
+        self.app.engine.set_limiter(value)
+        self.app.save_settings()
+
+    def quality_changed(self, value: str) -> None:
+        # only affects sounds loaded from now on
+        self.app.appinfo.resample_quality = value
+        self.app.sample_cache.quality = value
+        self.app.save_settings()
+
+    def normalize_changed(self) -> None:
+        # read per trigger, so it applies from the next press
+        self.app.appinfo.normalize = self.normalize_var.get()
+        self.app.save_settings()
+
+    def trim_silence_changed(self) -> None:
+        self.app.appinfo.trim_silence = self.trim_silence_var.get()
+        self.app.save_settings()
+
+    def effect_changed(self, name: str) -> None:
+        self.app.board.set_effect(name, self.effect_vars[name].get())
+        self.app.save_settings()
+
+    def replay_seconds_changed(self) -> None:
+        if not self.app.board.set_replay_seconds(self.replay_var.get()):
+            # the engine's command ring was full, leave the setting showing what's actually in use
+            self.replay_var.set(self.app.appinfo.replay_seconds)
+            return
+        self.app.save_settings()
+
+    def replay_to_board_changed(self) -> None:
+        self.app.appinfo.replay_to_board = self.replay_to_board_var.get()
+        self.app.save_settings()
+
+    def adaptive_changed(self) -> None:
+        # turning it off leaves the period wherever tuning got to
+        self.app.board.set_adaptive(self.adaptive_var.get())
+        self.app.save_settings()
+
+    def show_stats_changed(self) -> None:
+        self.app.appinfo.show_stats = self.show_stats_var.get()
+        self.app.set_stats_visible(self.app.appinfo.show_stats)
+        self.app.save_settings()
+
+
+class StatsFrame(ttk.Frame):
+    REFRESH: int = 500
+
+    def __init__(self, master: SoundboardApp, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+
+        self.app = master
+
+        self.title_label = ttk.Label(self, text="Stats")
+        self.title_label.grid(sticky="w")
+        self.text_label = ttk.Label(self, justify="left", font="TkFixedFont")
+        self.text_label.grid(sticky="w")
+
+        self._after: str | None = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        stats = self.app.get_stats()
+        chunk = stats["chunk_ms"]
+        latency = stats["latency_ms"]
+        cache = stats["sample_cache"]
+        lines = [
+            f"chunk      {chunk['mean']:.3f}ms avg  {chunk['max']:.3f}ms max  / {stats['period_ms']:.2f}ms",
+            f"overflows  {stats['input_overflows']}",
+            f"underruns  {stats['output_underruns']} cable  {stats['echo_underruns']} echo",
+            f"echo       {stats['echo']['dropped']} dropped  {stats['echo']['duplicated']} duplicated"
+            f"  {stats['echo']['starved']} starved  {stats['echo']['overflows']} overflows",
+            f"queue      {stats['queue_depth_max']} max",
+            f"voices     {stats['voices']}",
+            f"latency    {latency['p50']:.1f}ms p50  {latency['p95']:.1f}ms p95  {latency['max']:.1f}ms max",
+            f"cache      {cache['hits']} hits  {cache['misses']} misses  {cache['bytes'] / 1e6:.1f}MB",
+            f"streams    {stats['decoder']['streams']} open  {stats['decoder']['underruns']} underruns",
+        ]
+        self.text_label.configure(text="\n".join(lines))
+        self._after = self.after(self.REFRESH, self.refresh)
+
+    def destroy(self) -> None:
+        if self._after is not None:
+            self.after_cancel(self._after)
+            self._after = None
+        super().destroy()
 
 
 class SoundboardApp(tk.Tk):
     RESOLUTION: int = 1
-    AUDIO_FORMAT: int = pyaudio.paInt16
     CHANNELS: int = 2
     CHUNK: int = 512 * RESOLUTION
     RATE: int = 44100
-    DELAY: int = 1 * RESOLUTION
-    APPINFO_PATH: str = "appinfo.pickle"
+    APPINFO_PATH: str = "appinfo.sqlite3"
+    LEGACY_APPINFO_PATH: str = "appinfo.pickle"
+    ANALYSIS_PATH: str = "analysis.json"
+    DEVICES_PATH: str = "devices.json"
+    PEAK_DIRECTORY: str = PEAK_DIRECTORY
+    POLL: int = 100
+    ANIMATE: int = 40  # ms between playhead frames
 
     def __init__(self):
         super().__init__()
@@ -377,78 +979,169 @@ class SoundboardApp(tk.Tk):
         # default_font.config(family="Terminal")
         # print(font.families())
 
-        self.audio: pyaudio.PyAudio = pyaudio.PyAudio()
+        profile.mark("tk")
+
+        # nothing in here waits on portaudio: the window goes up with the cached device list, and enumerating and
+        # opening the devices happens in the background once it's painted
+        self.backend = PyAudioBackend(self.RATE, self.CHANNELS, self.CHUNK)
 
         self.pressed: Event[keyboard.Key] = Event()
         self.released: Event[keyboard.Key] = Event()
 
         self.pressed.add(self.on_pressed)
         self.released.add(self.on_released)
-
-        self.listener = keyboard.Listener(on_press=self.pressed.bind_invoke_sender(self), on_release=self.released.bind_invoke_sender(self))
-        self.listener.start()
-
-        self.global_keys: set[keyboard.Key] = set()
-
-        self.appinfo = self.load_appinfo()
+        self.listener = None
+
+        self.store = AppInfoStore(self.APPINFO_PATH, self.LEGACY_APPINFO_PATH)
+        self.appinfo = self.store.load()
+        profile.mark("settings")
+
+        self.board = Soundboard(self.backend, self.appinfo, self.CHUNK, self.CHANNELS, self.RATE, self.ANALYSIS_PATH,
+                                self.DEVICES_PATH, peak_directory=self.PEAK_DIRECTORY)
+        self.hotkeys = self.board.hotkeys
+        self.search = self.board.search
+        self.sample_cache = self.board.sample_cache
+        # from the tuner's thread, which is fine, the store only queues it up for its writer
+        self.board.tuner.tuned.add(lambda sender, chunk: self.save_settings())
+        self.engine: AudioEngine | None = None
+        profile.mark("board")
 
         self.devices: List[DeviceParameters] = []
         self.input_devices: List[DeviceParameters] = []
         self.output_devices: List[DeviceParameters] = []
         self.fetch_devices()
+        self.select_devices()
 
         self._terminated: bool = False
 
-        self.spec: SoundSpec = None
-        self.playback: Any = None
-
-        self.input_device: DeviceParameters = get_device_by_name(self.appinfo.input_device_name, self.input_devices)
-        self.set_input_device(self.input_device)
-        self.output_device: DeviceParameters = next((device for device in self.output_devices if re.match("cable", device["name"], re.IGNORECASE)), get_device_by_name(self.appinfo.output_device_name, self.output_devices))
-        self.set_output_device(self.output_device)
-        self.echo_device: DeviceParameters = get_device_by_name(self.appinfo.echo_device_name, self.output_devices)
-        self.set_echo_device(self.echo_device)
-
-        self.input_stream: pyaudio.Stream = self.get_stream(input=True, input_device_index=self.input_device["index"])
-        self.output_stream: pyaudio.Stream = self.get_stream(output=True, output_device_index=self.output_device["index"])
-        self.echo_stream: pyaudio.Stream = self.get_stream(output=True, output_device_index=self.echo_device["index"])
-
         self.settings = Settings(self)
-        self.settings.grid()
+        self.settings.grid(row=0, column=0)
+        # nothing to apply the settings to until the engine is up
+        self.settings.set_enabled(False)
+
+        self.stats_frame: StatsFrame | None = None
 
         self.thumbnails = Thumbnails(self)
-        self.thumbnails.grid()
+        self.thumbnails.grid(row=1, column=0, columnspan=2)
+
+        self.stats_dumper: StatsDumper | None = None
 
         self.editors: List[SoundEditor] = []
+        profile.mark("widgets")
 
-        self.save_appinfo()
+        # only while the window has focus, the global hotkeys are all for sounds
+        self.bind_all("<Control-r>", lambda event: self.save_replay())
 
-        self.update_audio()
+        self.after_idle(self.painted)
 
-    def load_appinfo(self) -> AppInfo:
-        try:
-            with open(self.APPINFO_PATH, "rb") as f:
-                appinfo = AppInfo.loads(f.read())
-                if appinfo.version != AppInfo.VERSION:
-                    appinfo = AppInfo()
-        except FileNotFoundError:
-            appinfo = AppInfo()
-        return appinfo
+    def painted(self) -> None:
+        profile.mark("window painted")
+        self.start_listener()
+        self.start_audio()
+        self.build_search()
+
+    def start_listener(self) -> None:
+        from pynput import keyboard
 
-    def save_appinfo(self) -> None:
-        with open(self.APPINFO_PATH, "wb") as f:
-            f.write(self.appinfo.dumps())
+        self.listener = keyboard.Listener(on_press=self.pressed.bind_invoke_sender(self), on_release=self.released.bind_invoke_sender(self))
+        self.listener.start()
+        profile.mark("hotkey listener")
+
+    def build_search(self) -> None:
+        # a slice per turn of the tk loop, so neither startup nor the first search waits on the whole index
+        if not self.search.build(BUILD_SLICE):
+            self.after(1, self.build_search)
+
+    def start_audio(self, refresh: bool = False) -> None:
+        self.settings.set_enabled(False)
+        if refresh or not self.board.devices.devices:
+            # first run, or the cached list turned out to be stale
+            self.when_done(self.board.devices.refresh_async(), lambda future: self.open_audio(refreshed=True))
+        else:
+            self.open_audio(refreshed=False)
+
+    def open_audio(self, refreshed: bool) -> None:
+        if refreshed:
+            profile.mark("devices enumerated")
+            self.fetch_devices()
+            self.select_devices()
+            self.settings.update_devices()
+        future = self.board.open_async(self.input_device["index"], self.output_device["index"],
+                                       self.echo_device["index"])
+        self.when_done(future, lambda future: self.audio_opened(future, refreshed))
+
+    def audio_opened(self, future, refreshed: bool) -> None:
+        if future.exception() is not None:
+            if not refreshed:
+                self.start_audio(refresh=True)
+                return
+            traceback.print_exception(future.exception())
+            from tkinter import messagebox
+
+            messagebox.showerror("Audio Devices", f"Couldn't open the audio devices.\n\n{future.exception()}",
+                                 parent=self)
+            # so another device can be picked, which tries again
+            self.settings.set_devices_enabled(True)
+            return
+
+        self.engine = future.result()
+        self.board.start()
+        profile.mark("streams open")
+
+        self.settings.set_enabled(True)
+        self.set_stats_visible(self.appinfo.show_stats)
+        if self.appinfo.stats_path:
+            self.stats_dumper = StatsDumper(self.get_stats, self.appinfo.stats_path, self.appinfo.stats_interval)
+            self.stats_dumper.start()
+        self.save_settings()
+
+        # sample loading would only have competed with the devices for the disk and the gil
+        self.board.preload()
+        self.animate()
+        profile.mark("ready")
+        profile.print()
+
+        if not refreshed:
+            # the menus were filled from the cache, check it against the real thing
+            self.when_done(self.board.devices.refresh_async(), self.devices_refreshed)
+
+    def animate(self) -> None:
+        playheads = self.board.playheads()
+        self.thumbnails.show_playheads(playheads)
+        for editor in self.editors:
+            editor.waveform.set_playheads(playheads.get(editor.spec, []))
+        self.after(self.ANIMATE, self.animate)
+
+    def save_settings(self) -> None:
+        self.store.save_settings(self.appinfo)
+
+    def save_replay(self) -> None:
+        self.when_done(self.board.save_replay(), self.replay_saved)
+
+    def replay_saved(self, future) -> None:
+        if future.exception() is not None:
+            traceback.print_exception(future.exception())
+            return
+        if not self.appinfo.replay_to_board:
+            return
+        for spec in self.board.add_imported([future.result()]):
+            self.thumbnails.add_thumbnail(spec)
+            self.store.save_spec(spec)
 
     def add_editor(self, spec: SoundSpec):
         self.editors.append(SoundEditor(self, spec))
 
     def remove_sound(self, editor: SoundEditor):
         spec = editor.spec
+        self.board.stop_sound(spec)
+        self.board.stop_sound(editor.test_spec)
         self.appinfo.sounds.remove(spec)
+        self.hotkeys.remove(spec)
+        self.search.remove(spec)
         self.thumbnails.remove_thumbnail(spec)
         editor.destroy()
         self.editors.remove(editor)
-        self.save_appinfo()
+        self.store.remove_spec(spec)
 
     # def get_input_device_by_name(self, name: str) -> DeviceParameters:
     #     return get_device_by_name(name, self.input_devices)
@@ -456,102 +1149,101 @@ class SoundboardApp(tk.Tk):
     # def get_output_device_by_name(self, name: str) -> DeviceParameters:
     #     return get_device_by_name(name, self.output_devices)
 
-    def keybind_met(self, keybind: set[keyboard.Key]):
-        if len(keybind) == 0:
-            return False
-        return all((key in self.global_keys) for key in keybind)
-
     def on_pressed(self, sender, key):
-        if key not in self.global_keys:
-            self.global_keys.add(key)
-
-        for sound in self.appinfo.sounds:
-            if self.keybind_met(sound.keys):
-                self.play_sound(sound)
+        self.board.on_pressed(key)
 
     def on_released(self, sender, key):
-        if key in self.global_keys:
-            self.global_keys.remove(key)
+        self.board.on_released(key)
 
     def set_input_device(self, device: DeviceParameters) -> None:
         self.input_device = device
         self.appinfo.input_device_name = device["name"]
-        # self.save_appinfo()
+        # self.save_settings()
 
     def set_output_device(self, device: DeviceParameters) -> None:
         self.output_device = device
         self.appinfo.output_device_name = device["name"]
-        # self.save_appinfo()
+        # self.save_settings()
 
     def set_echo_device(self, device: DeviceParameters) -> None:
         self.echo_device = device
         self.appinfo.echo_device_name = device["name"]
-        # self.save_appinfo()
-
-    def get_stream(self, *args, **kwargs) -> pyaudio.Stream:
-        return self.audio.open(format=self.AUDIO_FORMAT,
-                               channels=self.CHANNELS,
-                               rate=self.RATE,
-                               frames_per_buffer=self.CHUNK,
-                               *args,
-                               **kwargs)
+        # self.save_settings()
 
     def fetch_devices(self) -> None:
-        api_info = self.audio.get_host_api_info_by_index(0)
-        self.devices = [self.audio.get_device_info_by_index(i) for i in range(api_info["deviceCount"])]
+        # whatever is cached, start_audio enumerates in the background when there's nothing yet
+        self.devices = self.board.devices.devices
         # print("\n".join(map(str, self.devices)))
-        self.input_devices = [device for device in self.devices if device["maxInputChannels"] > 0]
-        self.output_devices = [device for device in self.devices if device["maxOutputChannels"] > 0]
+        self.input_devices = self.board.devices.input_devices
+        self.output_devices = self.board.devices.output_devices
+
+    def select_devices(self) -> None:
+        if not self.devices:
+            # keep the saved names until there's a real list to match them against
+            self.input_device = self.output_device = self.echo_device = NO_DEVICE
+            return
+        self.input_device: DeviceParameters = get_device_by_name(self.appinfo.input_device_name, self.input_devices)
+        self.set_input_device(self.input_device)
+        self.output_device: DeviceParameters = next((device for device in self.output_devices if re.match("cable", device["name"], re.IGNORECASE)), get_device_by_name(self.appinfo.output_device_name, self.output_devices))
+        self.set_output_device(self.output_device)
+        self.echo_device: DeviceParameters = get_device_by_name(self.appinfo.echo_device_name, self.output_devices)
+        self.set_echo_device(self.echo_device)
 
-    def play_sound(self, spec: SoundSpec):
-        self.spec = spec
-        wf = wave.open(spec.path, "rb")
-        self.set_playback(wf)
-
-    def set_playback(self, playback):
-        if self.playback is not None:
-            self.playback.close()
-
-        self.playback = playback
-
-    def update_audio(self) -> None:
-        input_bytes = self.input_stream.read(self.CHUNK, exception_on_overflow=False)
-        if self.playback is not None:
-            playback_bytes = self.playback.readframes(self.CHUNK)
-            pb_frame_count = len(playback_bytes)
-            if pb_frame_count == 0:
-                self.playback.close()
-                self.playback = None
-
-            # print(type(input_bytes), type(playback_bytes))
-            # self.output_stream.write(input_bytes)
-
-            delta = len(input_bytes) - pb_frame_count
-
-            if delta == 0:
-                self.write_output(mix(input_bytes, playback_bytes, volume_b=self.spec.volume))
-            else:  # there are fewer playback frames than mic frames
-                self.write_output(mix(input_bytes[:pb_frame_count], playback_bytes, volume_b=self.spec.volume))  # mix as many frames as we can
-                self.write_output(input_bytes[pb_frame_count:])  # play mic without mixing
+    def devices_refreshed(self, future) -> None:
+        if future.exception() is not None or not future.result():
+            return
+
+        previous = (self.input_device["index"], self.output_device["index"], self.echo_device["index"])
+        self.fetch_devices()
+        self.select_devices()
+
+        # indices move around when devices come and go, follow the names
+        if self.input_device["index"] != previous[0]:
+            self.board.devices.swap_input(self.engine, self.input_device["index"])
+        if self.output_device["index"] != previous[1]:
+            self.board.devices.swap_output(self.engine, self.output_device["index"])
+        if self.echo_device["index"] != previous[2]:
+            self.board.devices.swap_echo(self.engine, self.echo_device["index"])
+
+        self.settings.update_devices()
+        self.save_settings()
+
+    def swap_device(self, swap, index: int) -> None:
+        if self.engine is None:
+            # opening failed, there's nothing to swap into yet, so open again with the new choice
+            self.start_audio()
         else:
-            self.write_output(input_bytes)
+            swap(self.engine, index)
 
-        self.after(self.DELAY, self.update_audio)
+    def when_done(self, future, callback) -> None:
+        # tk isn't thread safe, so background work is polled for from the tk loop instead of calling back
+        if future.done():
+            callback(future)
+        else:
+            self.after(self.POLL, self.when_done, future, callback)
 
-    def write_output(self, frames: bytes) -> None:
-        self.output_stream.write(frames)
-        if self.appinfo.echo:
-            self.echo_stream.write(frames)
+    def play_sound(self, spec: SoundSpec, timestamp: int | None = None):
+        self.board.play_sound(spec, timestamp)
 
-    def terminate(self) -> None:
-        self.input_stream.close()
-        self.output_stream.close()
-        self.echo_stream.close()
+    def get_stats(self) -> dict:
+        return self.board.get_stats()
+
+    def set_stats_visible(self, visible: bool) -> None:
+        if visible and self.stats_frame is None:
+            self.stats_frame = StatsFrame(self, padding=5)
+            self.stats_frame.grid(row=0, column=1, sticky="n")
+        elif not visible and self.stats_frame is not None:
+            self.stats_frame.destroy()
+            self.stats_frame = None
 
-        self.audio.terminate()
+    def terminate(self) -> None:
+        if self.stats_dumper is not None:
+            self.stats_dumper.stop()
+        if self.listener is not None:
+            self.listener.stop()
 
-        if self.playback is not None:
-            self.playback.close()
+        self.board.close()
+        self.store.close()
 
         self._terminated = True
 
@@ -562,6 +1254,11 @@ class SoundboardApp(tk.Tk):
 
 
 if __name__ == '__main__':
+    # a frozen exe is its own import worker, this is where a worker stops instead of starting the app again
+    from multiprocessing import freeze_support
+
+    freeze_support()
+
     app = SoundboardApp()
 
     # s = ttk.Style()
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+
+
+INT16_MIN: int = -32768
+INT16_MAX: int = 32767
+
+LIMIT_CLIP: str = "clip"
+LIMIT_SOFT: str = "soft"
+
+
+class MixKernel:
+    def __init__(self, rows: int, samples: int, limiter: str = LIMIT_SOFT, threshold: float = 0.8):
+        self.limiter = limiter
+        self.threshold = threshold
+
+        self.block = np.zeros((rows, samples), dtype=np.float32)
+        self.gains = np.zeros(rows, dtype=np.float32)
+        self.acc = np.zeros(samples, dtype=np.float32)
+        self._magnitude = np.zeros(samples, dtype=np.float32)
+        self._excess = np.zeros(samples, dtype=np.float32)
+
+        self.out = np.zeros(samples, dtype=np.int16)
+        # pyaudio parses frames with "s#", which refuses memoryviews but takes a byte typed array without copying
+        self.out_bytes = self.out.view(np.uint8)
+
+    def run(self, rows: int) -> np.ndarray:
+        # acc = sum(gain_i * row_i) in one pass over every active row
+        np.matmul(self.gains[:rows], self.block[:rows], out=self.acc)
+
+        if self.limiter == LIMIT_SOFT:
+            self.soft_limit()
+        else:
+            np.clip(self.acc, INT16_MIN, INT16_MAX, out=self.acc)
+
+        np.rint(self.acc, out=self.acc)
+        np.copyto(self.out, self.acc, casting="unsafe")
+        return self.out_bytes
+
+    def soft_limit(self) -> None:
+        # linear up to the threshold, then a tanh knee that approaches but never reaches full scale
+        knee = self.threshold * INT16_MAX
+        headroom = INT16_MAX - knee
+
+        np.abs(self.acc, out=self._magnitude)
+        np.subtract(self._magnitude, knee, out=self._excess)
+        np.maximum(self._excess, 0, out=self._excess)
+        np.divide(self._excess, headroom, out=self._excess)
+        np.tanh(self._excess, out=self._excess)
+        np.multiply(self._excess, headroom, out=self._excess)
+        np.minimum(self._magnitude, knee, out=self._magnitude)
+        np.add(self._magnitude, self._excess, out=self._magnitude)
+        np.copysign(self._magnitude, self.acc, out=self.acc)
+
+
+class Voice:
+    def __init__(self, spec, sample, volume: float | None = None, timestamp: int = 0,
+                 start: int = 0, end: int | None = None, normalization: float = 1, stream=None):
+        self.spec = spec
+        self.sample = sample
+        # copied so the gui editing the spec can't race the audio thread
+        self.volume: float = spec.volume if volume is None else volume
+        # precomputed loudness gain, applied with the volume in the mix matmul
+        self.normalization = normalization
+        self.timestamp = timestamp
+        # start/end skip the silence found by the analysis
+        self.start = start
+        self.position: int = start
+        self.end: int = sample.frames if end is None else end
+        # DecodeStream picking up where a streamed sample's in memory head ends
+        self.stream = stream
+        self.started: bool = False
+        self.finished: bool = False
+
+        # frames of silence ahead of it in its first chunk, so a scheduled start lands on the exact frame
+        self.offset: int = 0
+        # frames left before a scheduled stop cuts it
+        self.stop_after: int | None = None
+        # steady fade level, and the ramp currently running as (from, to, length, frames into it)
+        self.level: float = 1
+        self.fade: tuple[float, float, int, int] | None = None
+
+    @property
+    def gain(self) -> float:
+        # a running fade is applied to the block row itself, frame by frame
+        return self.volume * self.normalization * (self.level if self.fade is None else 1)
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    def again(self) -> Voice:
+        # the next pass of a loop
+        return Voice(self.spec, self.sample, self.volume, 0, self.start, self.end, self.normalization)
+
+    def fade_to(self, level: float, frames: int, offset: int = 0) -> None:
+        # ramp from wherever it is now, starting offset frames into the next chunk it's mixed in
+        self.fade = (self.level, level, max(frames, 1), -offset)
+
+    def apply_fade(self, row: np.ndarray, channels: int) -> None:
+        start, end, length, done = self.fade
+        frames = np.arange(done, done + len(row) // channels, dtype=np.float32)
+        np.clip(frames / length, 0, 1, out=frames)
+        row.reshape(-1, channels)[:] *= (start + (end - start) * frames)[:, None]
+
+        done += len(frames)
+        if done < length:
+            self.fade = (start, end, length, done)
+            return
+        self.fade = None
+        self.level = end
+        if end == 0:
+            self.finished = True
+
+    def read(self, frames: int) -> np.ndarray:
+        self.started = True
+
+        if self.stop_after is not None:
+            frames = min(frames, self.stop_after)
+            self.stop_after -= frames
+            if self.stop_after == 0:
+                self.finished = True
+
+        if self.position < self.end:
+            # a view into the cached sample, nothing is copied until the mixer gathers it
+            data = self.sample.data[self.position:min(self.position + frames, self.end)]
+            self.position += len(data)
+            if self.stream is None:
+                if self.position >= self.end:
+                    self.finished = True
+                return data.reshape(-1)
+            if len(data) == frames:
+                return data.reshape(-1)
+            # the chunk where the head runs out and the stream takes over
+            rest = self.stream.read(frames - len(data))
+            self.position += len(rest) // self.sample.channels
+            return np.concatenate((data.reshape(-1), rest))
+
+        data = self.stream.read(frames)
+        self.position += len(data) // self.sample.channels
+        if self.stream.finished:
+            self.finished = True
+        return data
+
+    def close(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+
+
+class Mixer:
+    def __init__(self, chunk: int, channels: int, max_voices: int = 16, limiter: str = LIMIT_SOFT):
+        self.chunk = chunk
+        self.channels = channels
+        self.max_voices = max_voices
+        self.limiter = limiter
+
+        # oldest first, so stealing is always voices[0]
+        self.voices: List[Voice] = []
+        # voices that produced their first frames in the last mix
+        self.started: List[Voice] = []
+        # dsp.EffectChain run over the mic row before it's summed
+        self.effects = None
+
+        self._allocate()
+
+    def _allocate(self) -> None:
+        # row 0 is the mic, the rest are voices
+        self.kernel = MixKernel(self.max_voices + 1, self.chunk * self.channels, self.limiter)
+
+    def set_max_voices(self, max_voices: int) -> None:
+        self.max_voices = max(1, max_voices)
+        while len(self.voices) > self.max_voices:
+            self.voices.pop(0).close()
+        self._allocate()
+
+    def set_chunk(self, chunk: int) -> None:
+        self.chunk = chunk
+        self._allocate()
+
+    def set_limiter(self, limiter: str) -> None:
+        self.limiter = limiter
+        self.kernel.limiter = limiter
+
+    def add(self, voice: Voice) -> None:
+        if len(self.voices) >= self.max_voices:
+            self.voices.pop(0).close()  # steal oldest
+        self.voices.append(voice)
+
+    def stop(self, spec=None) -> None:
+        for voice in self.voices:
+            if spec is None or voice.spec is spec:
+                voice.finished = True
+                voice.close()
+        self.voices = [voice for voice in self.voices if not voice.finished]
+
+    def clear(self) -> None:
+        for voice in self.voices:
+            voice.close()
+        self.voices = []
+
+    def mix(self, mic: np.ndarray) -> np.ndarray:
+        block = self.kernel.block
+        gains = self.kernel.gains
+
+        block[0, :len(mic)] = mic
+        block[0, len(mic):] = 0
+        gains[0] = 1
+        if self.effects is not None and self.effects.enabled:
+            self.effects.process(block[0].reshape(-1, self.channels))
+
+        self.started.clear()
+
+        n = 1
+        for voice in self.voices:
+            if not voice.started:
+                self.started.append(voice)
+            offset = voice.offset * self.channels
+            data = voice.read(self.chunk - voice.offset)
+            if offset:
+                block[n, :offset] = 0
+                voice.offset = 0
+            block[n, offset:offset + len(data)] = data
+            block[n, offset + len(data):] = 0
+            # the gain is taken before the fade moves on, a fade ending this chunk already shaped the row
+            gains[n] = voice.gain
+            if voice.fade is not None:
+                voice.apply_fade(block[n], self.channels)
+            n += 1
+
+        frames = self.kernel.run(n)
+
+        if any(voice.finished for voice in self.voices):
+            for voice in self.voices:
+                if voice.finished:
+                    voice.close()
+            self.voices = [voice for voice in self.voices if not voice.finished]
+
+        return frames
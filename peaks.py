@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Iterator, List
+
+import numpy as np
+
+from convert import QUALITY_FAST
+from decoders import load_file
+
+
+PEAK_DIRECTORY: str = "peaks"
+BUCKET: int = 256  # frames per min/max pair at the finest level
+MEMORY_BUDGET: int = 32 * 1024 * 1024  # bytes of pyramids kept in memory
+
+
+@contextmanager
+def replacing(path: str, mode: str = "wb") -> Iterator[IO]:
+    # written next to path under a name of its own and renamed over it, so two threads saving the same file never
+    # truncate each other's half and a reader only ever sees a whole one
+    fd, temp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def level_lengths(frames: int) -> List[int]:
+    lengths = [max(1, -(-frames // BUCKET))]
+    while lengths[-1] > 1:
+        lengths.append(-(-lengths[-1] // 2))
+    return lengths
+
+
+def build_pyramid(data: np.ndarray) -> List[np.ndarray]:
+    # (frames, channels) int16 -> levels of (n, 2) int16 min/max pairs across all channels, finest first, each
+    # level half the length of the one before down to a single pair
+    frames = len(data)
+    if frames == 0:
+        return [np.zeros((1, 2), dtype=np.int16)]
+
+    whole = frames // BUCKET * BUCKET
+    blocks = data[:whole].reshape(-1, BUCKET * data.shape[1])
+    low, high = blocks.min(axis=1), blocks.max(axis=1)
+    if whole < frames:
+        low = np.append(low, data[whole:].min())
+        high = np.append(high, data[whole:].max())
+    level = np.stack((low, high), axis=1).astype(np.int16, copy=False)
+
+    levels = [level]
+    while len(level) > 1:
+        if len(level) % 2:
+            level = np.concatenate((level, level[-1:]))
+        pairs = level.reshape(-1, 2, 2)
+        level = np.stack((pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)), axis=1)
+        levels.append(level)
+    return levels
+
+
+class Peaks:
+    def __init__(self, levels: List[np.ndarray], frames: int, rate: int):
+        self.levels = levels
+        # of the whole file, a streamed sample's head doesn't count
+        self.frames = frames
+        self.rate = rate
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.rate
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def columns(self, width: int) -> tuple[np.ndarray, np.ndarray]:
+        # min and max in -1..1 for up to width columns, reduced from the coarsest level that still has one pair
+        # per column so drawing never touches more than about twice that
+        level = next((level for level in reversed(self.levels) if len(level) >= width), self.levels[0])
+        edges = np.arange(min(width, len(level))) * len(level) // min(width, len(level))
+        low = np.minimum.reduceat(level[:, 0], edges) / 32768
+        high = np.maximum.reduceat(level[:, 1], edges) / 32768
+        return low, high
+
+    def outline(self, width: int, height: int) -> List[float]:
+        # canvas coords for one polygon, along the tops and back along the bottoms
+        low, high = self.columns(width)
+        x = np.linspace(0, width - 1, len(low))
+        middle = height / 2
+        top = middle - high * (middle - 1)
+        # silence still gets a hairline
+        bottom = np.maximum(middle - low * (middle - 1), top + 1)
+        return np.concatenate((np.stack((x, top), axis=1), np.stack((x, bottom), axis=1)[::-1])).ravel().tolist()
+
+    def save(self, path: str) -> None:
+        # frames and rate, then every level back to back. the level lengths follow from frames, so that's all the
+        # header there is and loading is one read (npz spends a millisecond a file in zipfile)
+        with replacing(path) as f:
+            f.write(np.array([self.frames, self.rate], dtype="<i8").tobytes())
+            for level in self.levels:
+                f.write(level.astype("<i2", copy=False).tobytes())
+
+    @staticmethod
+    def load(path: str) -> Peaks:
+        with open(path, "rb") as f:
+            buffer = f.read()
+        frames, rate = (int(value) for value in np.frombuffer(buffer, dtype="<i8", count=2))
+        pairs = np.frombuffer(buffer, dtype="<i2", offset=16).reshape(-1, 2)
+        lengths = level_lengths(frames)
+        if len(pairs) != sum(lengths):
+            raise ValueError(f"{path} is truncated.")
+        edges = np.cumsum(lengths)[:-1]
+        return Peaks(np.split(pairs, edges), frames, rate)
+
+
+class PeakCache:
+    # waveform previews keyed by content hash, one small file each. the index maps a path to the mtime and hash it
+    # had when it was last looked at, so drawing a thumbnail needs a stat and never reads the audio. a changed mtime
+    # means the pyramid gets rebuilt from the audio, in the background
+
+    def __init__(self, directory: str | None, rate: int = 44100, channels: int = 2, quality: str = QUALITY_FAST,
+                 ffmpeg: str | None = None):
+        # None keeps everything in memory
+        self.directory = directory
+        self.rate = rate
+        self.channels = channels
+        self.quality = quality
+        self.ffmpeg = ffmpeg
+
+        # path -> [mtime, digest]
+        self._index: dict[str, list] = {}
+        # digest -> peaks, least recently used first
+        self._memory: OrderedDict[str, Peaks] = OrderedDict()
+        self._memory_size: int = 0
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._dirty: bool = False
+        # one at a time, building a preview should never compete with playback for cores
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="Peaks")
+
+        if directory is not None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError):
+                traceback.print_exc()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def file_path(self, digest: str) -> str:
+        # frame counts depend on the internal rate, the channels are folded together anyway
+        return os.path.join(self.directory, f"{digest}-{self.rate}.peaks")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def digest(self, path: str) -> str | None:
+        # the hash the file had when its peaks were built, if it hasn't been touched since
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._index.get(path)
+        return entry[1] if entry is not None and entry[0] == mtime else None
+
+    def get(self, path: str) -> Peaks | None:
+        # gui thread. a stat and, the first time round, one small file
+        digest = self.digest(path)
+        if digest is None:
+            return None
+
+        with self._lock:
+            peaks = self._memory.get(digest)
+            if peaks is not None:
+                self._memory.move_to_end(digest)
+                return peaks
+        if self.directory is None:
+            return None
+
+        try:
+            peaks = Peaks.load(self.file_path(digest))
+        except (OSError, ValueError):
+            return None  # gone or cut short, it gets rebuilt
+        self._remember(digest, peaks)
+        return peaks
+
+    def put(self, path: str, mtime: float, digest: str, data: np.ndarray) -> Peaks:
+        # any thread that already has the whole file decoded
+        with self._lock:
+            peaks = self._memory.get(digest)
+        if peaks is None:
+            peaks = Peaks(build_pyramid(data), len(data), self.rate)
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                peaks.save(self.file_path(digest))
+            self._remember(digest, peaks)
+
+        with self._lock:
+            self._index[path] = [mtime, digest]
+            self._dirty = True
+        return peaks
+
+    def add(self, path: str, sample) -> None:
+        # from the preload, whose sample is already in memory anyway. a streamed sample only has its head, that
+        # one's left to request
+        if sample.streaming or self.digest(path) is not None:
+            return
+        self.put(path, os.stat(path).st_mtime, sample.digest, sample.data)
+
+    def request(self, path: str) -> Future:
+        # resolves to the peaks, built off the gui thread from the file if they aren't cached
+        peaks = self.get(path)
+        if peaks is not None:
+            future = Future()
+            future.set_result(peaks)
+            return future
+
+        return self._submit(path, self.build, path)
+
+    def put_async(self, path: str, mtime: float, digest: str, data: np.ndarray) -> Future:
+        # put, off the calling thread
+        return self._submit(path, self.put, path, mtime, digest, data)
+
+    def _submit(self, path: str, f, *args) -> Future:
+        # one build per path in flight, asking again just gets the same future
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._pending[path] = self._executor.submit(f, *args)
+                future.add_done_callback(lambda done: self._pending.pop(path, None))
+        return future
+
+    def build(self, path: str) -> Peaks:
+        mtime = os.stat(path).st_mtime
+        sample = load_file(path, self.rate, self.channels, self.quality, self.ffmpeg)
+        return self.put(path, mtime, sample.digest, sample.data)
+
+    def _remember(self, digest: str, peaks: Peaks) -> None:
+        with self._lock:
+            previous = self._memory.pop(digest, None)
+            if previous is not None:
+                self._memory_size -= previous.nbytes
+            self._memory[digest] = peaks
+            self._memory_size += peaks.nbytes
+            while self._memory_size > MEMORY_BUDGET and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= evicted.nbytes
+
+    def save(self) -> None:
+        if self.directory is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            serialised = json.dumps(self._index)
+            self._dirty = False
+
+        os.makedirs(self.directory, exist_ok=True)
+        with replacing(self.index_path, "w") as f:
+            f.write(serialised)
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+        self.save()
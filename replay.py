@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import io
+import os
+import time
+import wave
+
+import numpy as np
+
+
+REPLAY_DIRECTORY: str = "replays"
+
+
+class ReplayBuffer:
+    # the last however many seconds of exactly what went out over the cable. the audio thread copies each chunk in,
+    # nothing is allocated after construction and nothing is locked: readers check afterwards whether the writer
+    # lapped them and drop whatever it overwrote
+
+    def __init__(self, seconds: float, rate: int, channels: int):
+        self.rate = rate
+        self.channels = channels
+        self.capacity = max(1, int(seconds * rate))
+        self.buffer = np.zeros((self.capacity, channels), dtype=np.int16)
+        # frames ever written, only bumped once a write's frames are in place
+        self.written: int = 0
+        # the biggest single write, how far ahead of written the writer can be scribbling
+        self.largest: int = 0
+
+    @property
+    def seconds(self) -> float:
+        return self.capacity / self.rate
+
+    def write(self, frames: np.ndarray) -> None:
+        # audio thread, frames is (n, channels) int16
+        n = len(frames)
+        if n > self.capacity:
+            frames = frames[-self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+        if n > self.largest:
+            self.largest = n
+
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = frames[:first]
+        self.buffer[:n - first] = frames[first:]
+        self.written += n
+
+    def snapshot(self, seconds: float | None = None) -> np.ndarray:
+        # any thread, a copy of the most recent frames, oldest first
+        end = self.written
+        n = min(end, self.capacity)
+        if seconds is not None:
+            n = min(n, int(seconds * self.rate))
+
+        start = (end - n) % self.capacity
+        first = min(n, self.capacity - start)
+        out = np.empty((n, self.channels), dtype=np.int16)
+        out[:first] = self.buffer[start:start + first]
+        out[first:] = self.buffer[:n - first]
+
+        # the writer may have gone round while this was copying, anything it reached is a mix of old and new
+        lapped = self.written + self.largest - self.capacity - (end - n)
+        if lapped > 0:
+            out = out[lapped:]
+        return out
+
+
+def wav_bytes(data: np.ndarray, rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(data.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(data.astype("<i2", copy=False).tobytes())
+    return buffer.getvalue()
+
+
+def replay_path(directory: str = REPLAY_DIRECTORY) -> str:
+    # a second replay in the same second gets a suffix
+    stem = os.path.join(directory, time.strftime("replay-%Y%m%d-%H%M%S"))
+    path = stem + ".wav"
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{stem}-{n}.wav"
+    return path
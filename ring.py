@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import Generic, List, TypeVar
+
+import numpy as np
+
+
+T = TypeVar("T")
+
+
+class SPSCRing(Generic[T]):
+    # one producer thread, one consumer thread, no locks.
+    # each index is only ever written by one side and the slot is filled before the index is published,
+    # which the gil makes visible to the other side in order.
+
+    def __init__(self, capacity: int = 256):
+        size = 1
+        while size < capacity:
+            size <<= 1
+
+        self.capacity = size
+        self._mask = size - 1
+        self._buffer: List[T | None] = [None] * size
+        self._head: int = 0  # consumer
+        self._tail: int = 0  # producer
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def push(self, item: T) -> bool:
+        tail = self._tail
+        if tail - self._head >= self.capacity:
+            return False
+        self._buffer[tail & self._mask] = item
+        self._tail = tail + 1
+        return True
+
+    def pop(self) -> T | None:
+        head = self._head
+        if head == self._tail:
+            return None
+        index = head & self._mask
+        item = self._buffer[index]
+        self._buffer[index] = None
+        self._head = head + 1
+        return item
+
+
+class PCMRing:
+    # the same single producer single consumer scheme over a block of (frames, channels) int16 pcm.
+    # the counters only grow, the producer owns written and the consumer owns read
+
+    def __init__(self, capacity: int, channels: int):
+        self.capacity = capacity
+        self.channels = channels
+        self.buffer = np.zeros((capacity, channels), dtype=np.int16)
+        self.written: int = 0
+        self.read: int = 0
+
+    def __len__(self) -> int:
+        return self.written - self.read
+
+    @property
+    def space(self) -> int:
+        return self.capacity - len(self)
+
+    def write(self, frames: np.ndarray) -> int:
+        # producer side, writes as much as fits and returns how much that was
+        n = min(len(frames), self.space)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = frames[:first]
+        self.buffer[:n - first] = frames[first:n]
+        self.written += n
+        return n
+
+    def read_into(self, out: np.ndarray, frames: int) -> int:
+        # consumer side, copies up to frames into out and returns how many there were
+        n = min(frames, len(self))
+        start = self.read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:n] = self.buffer[:n - first]
+        self.read += n
+        return n
+
+    def skip(self, frames: int) -> int:
+        n = min(frames, len(self))
+        self.read += n
+        return n
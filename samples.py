@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
+
+from analysis import Analysis, AnalysisCache, content_hash
+from convert import QUALITY_FAST, convert
+from wavmap import MappedWave, WaveFormatError, parse_header
+
+
+class Sample:
+    streaming: bool = False
+
+    def __init__(self, data: np.ndarray, rate: int, path: str = "", digest: str = ""):
+        # (frames, channels) int16, ready to hand straight to the mixer
+        self.data = data
+        self.rate = rate
+        self.path = path
+        # hash of the source file, keys the analysis cache
+        self.digest = digest
+        self.analysis: Analysis | None = None
+
+    @property
+    def frames(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def channels(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+
+def load_sample(path: str, rate: int = 44100, channels: int = 2, quality: str = QUALITY_FAST) -> Sample:
+    with open(path, "rb") as f:
+        buffer = f.read()
+    return Sample(convert(buffer, parse_header(buffer), rate, channels, quality), rate, path, content_hash(buffer))
+
+
+class SampleCache:
+    def __init__(self, budget: int = 256 * 1024 * 1024, map_threshold: int = 32 * 1024 * 1024,
+                 rate: int = 44100, channels: int = 2, quality: str = QUALITY_FAST,
+                 analyses: AnalysisCache | None = None, decoders=None, peaks=None):
+        self.budget = budget
+        # everything is converted to this on load so the mixer never has to care
+        self.rate = rate
+        self.channels = channels
+        self.quality = quality
+        # files at least this big are memory mapped instead of decoded into memory
+        self.map_threshold = map_threshold
+        # loudness and silence, filled in by preload so the trigger path never analyses anything
+        self.analyses = analyses
+        # DecoderPool for anything that isn't wav
+        self.decoders = decoders
+        # PeakCache, also filled in by preload while the audio is in memory anyway
+        self.peaks = peaks
+
+        # path -> (mtime, sample), least recently used first
+        self._entries: OrderedDict[str, tuple[float, Sample | MappedWave]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    def get(self, path: str) -> Sample | MappedWave | None:
+        # trigger path, no file io at all
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def load(self, path: str) -> Sample | MappedWave:
+        stat = os.stat(path)
+        mtime = stat.st_mtime
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        sample = None
+        if self.decoders is not None and self.decoders.handles(path):
+            sample = self.decoders.load(path)
+        elif stat.st_size >= self.map_threshold:
+            try:
+                sample = MappedWave(path)
+            except WaveFormatError:
+                pass  # not directly mappable, decode it instead
+            else:
+                if sample.rate != self.rate or sample.channels != self.channels:
+                    sample = None
+        if sample is None:
+            sample = load_sample(path, self.rate, self.channels, self.quality)
+
+        # a sample evicted and loaded again still has its analysis on disk, so it doesn't play untrimmed and
+        # unnormalised just because the cache was busy. mapped files are never evicted (see _evict) and hashing
+        # one would read all of it, so those are left to preload
+        if self.analyses is not None and isinstance(sample, Sample):
+            sample.analysis = self.analyses.get(AnalysisCache.key(sample.digest, self.rate, self.channels))
+
+        self.put(path, mtime, sample)
+        return sample
+
+    def put(self, path: str, mtime: float, sample: Sample | MappedWave) -> None:
+        with self._lock:
+            self._discard(path)
+
+            if sample.nbytes > self.budget:
+                return
+
+            self._entries[path] = (mtime, sample)
+            self.size += sample.nbytes
+            self._evict()
+
+    def discard(self, path: str) -> None:
+        with self._lock:
+            self._discard(path)
+
+    def _discard(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[1].nbytes
+
+    def _evict(self) -> None:
+        # mapped files cost the budget nothing, evicting one would free nothing and only lose its analysis
+        while self.size > self.budget:
+            path = next((path for path, (_, sample) in self._entries.items() if sample.nbytes), None)
+            if path is None:
+                break
+            self._discard(path)
+
+    def set_budget(self, budget: int) -> None:
+        with self._lock:
+            self.budget = budget
+            self._evict()
+
+    def analyse(self, sample: Sample | MappedWave) -> None:
+        if self.analyses is not None and sample.analysis is None and not sample.streaming:
+            sample.analysis = self.analyses.analyse(sample.digest, sample.data, self.rate)
+
+    def preload(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            try:
+                sample = self.load(path)
+                self.analyse(sample)
+                if self.peaks is not None:
+                    self.peaks.add(path, sample)
+            except (OSError, WaveFormatError):
+                pass  # broken paths are reported when the sound is actually played
+
+        for cache in (self.analyses, self.peaks):
+            if cache is None:
+                continue
+            try:
+                cache.save()
+            except OSError:
+                traceback.print_exc()
+
+    def preload_async(self, paths: Iterable[str]) -> threading.Thread:
+        thread = threading.Thread(target=self.preload, args=(list(paths),), name="SamplePreload", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import List
+
+from mixer import Mixer, Voice
+
+
+START: int = 0
+STOP: int = 1
+
+FOREVER: int = 0  # loops value that repeats until the sound is stopped
+
+
+class ScheduledEvent:
+    __slots__ = ("at", "order", "kind", "spec", "voice", "loops", "crossfade")
+
+    def __init__(self, at: int, kind: int, spec=None, voice: Voice | None = None, loops: int = 1,
+                 crossfade: int = 0):
+        # output frame it happens on. relative to the trigger until the engine takes it in
+        self.at = at
+        self.order: int = 0
+        self.kind = kind
+        self.spec = spec
+        self.voice = voice
+        # passes left including this one, FOREVER to keep going
+        self.loops = loops
+        # frames the end of one pass overlaps the start of the next, or a stop fades out over
+        self.crossfade = crossfade
+
+    def __lt__(self, other: ScheduledEvent) -> bool:
+        return (self.at, self.order) < (other.at, other.order)
+
+
+def start(at: int, voice: Voice, loops: int = 1, crossfade: int = 0) -> ScheduledEvent:
+    return ScheduledEvent(at, START, voice.spec, voice, loops, crossfade)
+
+
+def stop(at: int, spec=None, fade: int = 0) -> ScheduledEvent:
+    return ScheduledEvent(at, STOP, spec, crossfade=fade)
+
+
+class Scheduler:
+    # time ordered events against the output sample clock. only ever touched on the audio thread, each chunk runs
+    # everything due before its last frame with the event's offset into it
+
+    def __init__(self, mixer: Mixer):
+        self.mixer = mixer
+        self.events: List[ScheduledEvent] = []
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def add(self, event: ScheduledEvent) -> None:
+        # ties go in the order they were added
+        event.order = next(self._order)
+        heapq.heappush(self.events, event)
+
+    def cancel(self, spec=None) -> None:
+        events = [event for event in self.events if spec is not None and event.spec is not spec]
+        for event in self.events:
+            if event.kind == START and (spec is None or event.spec is spec):
+                event.voice.close()
+        self.events = events
+        heapq.heapify(self.events)
+
+    def run(self, clock: int, chunk: int) -> None:
+        while self.events and self.events[0].at < clock + chunk:
+            event = heapq.heappop(self.events)
+            # anything late goes at the start of this chunk
+            offset = max(0, event.at - clock)
+            if event.kind == START:
+                self.start(event, offset)
+            elif event.kind == STOP:
+                self.stop(event, offset)
+
+    def start(self, event: ScheduledEvent, offset: int) -> None:
+        voice = event.voice
+        voice.offset = offset
+        if event.crossfade and voice.level == 0:
+            voice.fade_to(1, event.crossfade, offset)
+        self.mixer.add(voice)
+
+        # streamed sounds decode once per voice on the caller's side, so they only ever play through once
+        if event.loops == 1 or voice.stream is not None or voice.length <= 0:
+            return
+        # the next pass starts a crossfade before this one ends, this one fades out under it
+        crossfade = min(event.crossfade, voice.length // 2)
+        at = event.at + voice.length - crossfade
+        following = voice.again()
+        if crossfade:
+            following.level = 0
+            self.add(ScheduledEvent(at, STOP, event.spec, voice, crossfade=crossfade))
+        loops = FOREVER if event.loops == FOREVER else event.loops - 1
+        self.add(ScheduledEvent(at, START, event.spec, following, loops, crossfade))
+
+    def stop(self, event: ScheduledEvent, offset: int) -> None:
+        if event.voice is not None:
+            voices = [event.voice] if event.voice in self.mixer.voices else []
+        else:
+            voices = [voice for voice in self.mixer.voices if event.spec is None or voice.spec is event.spec]
+            # pending loop passes and anything else queued for it go too
+            self.cancel(event.spec)
+        for voice in voices:
+            if event.crossfade:
+                voice.fade_to(0, event.crossfade, offset)
+            else:
+                voice.stop_after = offset
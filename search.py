@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import itertools
+import os
+from typing import Iterable, List
+
+
+GRAM: int = 3
+BUILD_SLICE: int = 200  # specs indexed per slice of the background build, a few ms each
+
+
+def searchable_text(spec) -> str:
+    return f"{spec.name} {os.path.basename(spec.path)}".lower()
+
+
+def grams(text: str) -> set[str]:
+    # every 1..3 gram, so one and two letter queries hit the index too
+    return {text[i:i + n] for n in range(1, GRAM + 1) for i in range(len(text) - n + 1)}
+
+
+def query_grams(word: str) -> set[str]:
+    if len(word) <= GRAM:
+        return {word}
+    return {word[i:i + GRAM] for i in range(len(word) - GRAM + 1)}
+
+
+class SearchIndex:
+    # n-gram index over spec name and file name, kept up to date alongside the hotkey index
+
+    def __init__(self, specs: Iterable = ()):
+        self._postings: dict[str, set] = {}
+        # first character -> specs, so a one letter query is the names starting with it rather than half the board
+        self._initials: dict[str, set] = {}
+        # spec -> (text it was indexed under, insertion order)
+        self._indexed: dict[object, tuple[str, int]] = {}
+        self._next: int = 0
+        # specs in result order, rebuilt after adds and removes
+        self._ordered: List | None = None
+        # specs not indexed yet, in board order. built a slice at a time from the tk loop, or all at once by a
+        # search that comes first
+        self._unbuilt: dict = {}
+
+        self.rebuild(specs)
+
+    def __len__(self) -> int:
+        return len(self._indexed) + len(self._unbuilt)
+
+    @property
+    def built(self) -> bool:
+        return not self._unbuilt
+
+    def rebuild(self, specs: Iterable) -> None:
+        self._postings = {}
+        self._initials = {}
+        self._indexed = {}
+        self._next = 0
+        self._ordered = None
+        self._unbuilt = dict.fromkeys(specs)
+
+    def build(self, limit: int | None = None) -> bool:
+        # indexes up to limit of the specs still waiting, True once there are none left
+        batch = list(itertools.islice(self._unbuilt, limit))
+        for spec in batch:
+            del self._unbuilt[spec]
+            self._insert(spec)
+        return self.built
+
+    def add(self, spec) -> None:
+        if self._unbuilt:
+            # behind the ones still waiting, so the order stays the board's
+            self._unbuilt[spec] = None
+            return
+        self._insert(spec)
+
+    def _insert(self, spec, order: int | None = None) -> None:
+        text = searchable_text(spec)
+        if order is None:
+            order = self._next
+            self._next += 1
+        self._indexed[spec] = (text, order)
+        self._ordered = None
+        for gram in grams(text):
+            self._postings.setdefault(gram, set()).add(spec)
+        if text:
+            self._initials.setdefault(text[0], set()).add(spec)
+
+    def remove(self, spec) -> None:
+        if spec in self._unbuilt:
+            del self._unbuilt[spec]
+            return
+
+        entry = self._indexed.pop(spec, None)
+        if entry is None:
+            return
+        self._ordered = None
+        for gram in grams(entry[0]):
+            postings = self._postings[gram]
+            postings.discard(spec)
+            if not postings:
+                del self._postings[gram]
+        if entry[0]:
+            initials = self._initials[entry[0][0]]
+            initials.discard(spec)
+            if not initials:
+                del self._initials[entry[0][0]]
+
+    def update(self, spec) -> None:
+        if spec in self._unbuilt:
+            return  # indexed under whatever it says by the time it's built
+
+        entry = self._indexed.get(spec)
+        if entry is None:
+            self.add(spec)
+        elif entry[0] != searchable_text(spec):
+            # keep its place in the results
+            self.remove(spec)
+            self._insert(spec, entry[1])
+
+    def ordered(self) -> List:
+        if self._ordered is None:
+            self._ordered = sorted(self._indexed, key=lambda spec: self._indexed[spec][1])
+        return self._ordered
+
+    def search(self, query: str) -> List:
+        # every word has to appear somewhere. names starting with the query come first, then board order
+        if self._unbuilt:
+            self.build()
+
+        words = query.lower().split()
+        if not words:
+            return list(self.ordered())
+
+        if len(words) == 1 and len(words[0]) == 1:
+            # nearly every name has any given letter in it, so one letter only looks for names that start with it
+            return sorted(self._initials.get(words[0], ()), key=lambda spec: self._indexed[spec][1])
+
+        candidates = None
+        for word in words:
+            for gram in sorted(query_grams(word), key=lambda gram: len(self._postings.get(gram, ()))):
+                postings = self._postings.get(gram)
+                if not postings:
+                    return []
+                candidates = set(postings) if candidates is None else candidates & postings
+
+        # a broad query is cheaper to filter out of the ordered list than to sort
+        if len(candidates) > len(self._indexed) // 8:
+            hits = [spec for spec in self.ordered() if spec in candidates]
+        else:
+            hits = sorted(candidates, key=lambda spec: self._indexed[spec][1])
+
+        if any(len(word) > GRAM for word in words):
+            # grams only narrow it down, long words still have to match in one piece
+            hits = [spec for spec in hits if all(word in self._indexed[spec][0] for word in words)]
+
+        query = " ".join(words)
+        first = [spec for spec in hits if self._indexed[spec][0].startswith(query)]
+        if not first:
+            return hits
+        rest = [spec for spec in hits if not self._indexed[spec][0].startswith(query)]
+        return first + rest
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import List
+
+
+class StartupProfile:
+    # wall clock marks from process start to the soundboard being ready, printed with --profile-startup.
+    # marks can come from any thread, each one is timed from the one before it
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.marks: List[tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str) -> None:
+        with self._lock:
+            self.marks.append((phase, time.perf_counter(), threading.current_thread().name))
+
+    def report(self) -> str:
+        lines = [f"{'phase':<24} {'took':>9} {'at':>9}  thread"]
+        previous = self.start
+        for phase, at, thread in self.marks:
+            lines.append(f"{phase:<24} {(at - previous) * 1e3:>7.1f}ms {(at - self.start) * 1e3:>7.1f}ms  {thread}")
+            previous = at
+        return "\n".join(lines)
+
+    def print(self) -> None:
+        if self.enabled:
+            print(self.report(), file=sys.stderr)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List
+
+import numpy as np
+
+
+# upper edges in milliseconds, the last bucket catches everything else
+LATENCY_BUCKETS_MS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class Histogram:
+    def __init__(self, edges=LATENCY_BUCKETS_MS):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(edges) + 1, dtype=np.int64)
+
+    def add(self, value: float) -> None:
+        self.counts[np.searchsorted(self.edges, value)] += 1
+
+    def reset(self) -> None:
+        self.counts[:] = 0
+
+    def to_dict(self) -> dict:
+        labels = [f"<{edge:g}" for edge in self.edges] + [f">={self.edges[-1]:g}"]
+        return dict(zip(labels, self.counts.tolist()))
+
+
+class EngineStats:
+    HISTORY: int = 1024
+
+    def __init__(self, period: float):
+        # seconds one chunk lasts at the device rate
+        self.period = period
+
+        self.chunks: int = 0
+        self.input_overflows: int = 0
+        self.output_underruns: int = 0
+        self.echo_underruns: int = 0
+        # echo jitter buffer: chunks dropped because it was full, chunks of silence because it ran dry,
+        # frames dropped or duplicated to follow clock drift, and hard jumps back to the target
+        self.echo_overflows: int = 0
+        self.echo_starved: int = 0
+        self.echo_dropped: int = 0
+        self.echo_duplicated: int = 0
+        self.echo_resyncs: int = 0
+        self.queue_depth_max: int = 0
+
+        # seconds spent mixing each chunk, not counting the blocking device calls
+        self.chunk_times: deque[float] = deque(maxlen=self.HISTORY)
+        # milliseconds from key press to the first sample being handed to the device
+        self.latencies: deque[float] = deque(maxlen=self.HISTORY)
+        self.latency_histogram = Histogram()
+
+    def record_chunk(self, seconds: float) -> None:
+        self.chunks += 1
+        self.chunk_times.append(seconds)
+
+    def record_queue_depth(self, depth: int) -> None:
+        if depth > self.queue_depth_max:
+            self.queue_depth_max = depth
+
+    def record_latency(self, nanoseconds: int) -> None:
+        ms = nanoseconds / 1e6
+        self.latencies.append(ms)
+        self.latency_histogram.add(ms)
+
+    def reset(self) -> None:
+        self.__init__(self.period)
+
+    def set_period(self, period: float) -> None:
+        # timings against the old period would skew the new one
+        self.period = period
+        self.chunk_times.clear()
+
+    def snapshot(self) -> dict:
+        # list() of a deque runs entirely under the gil so this is safe against the audio thread appending
+        chunk_ms = np.array(list(self.chunk_times)) * 1e3
+        latency_ms = np.array(list(self.latencies))
+
+        def percentiles(values: np.ndarray) -> dict:
+            if len(values) == 0:
+                return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            return {"mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99),
+                    "max": float(values.max())}
+
+        return {
+            "time": time.time(),
+            "chunks": self.chunks,
+            "period_ms": self.period * 1e3,
+            "chunk_ms": percentiles(chunk_ms),
+            "input_overflows": self.input_overflows,
+            "output_underruns": self.output_underruns,
+            "echo_underruns": self.echo_underruns,
+            "echo": {
+                "overflows": self.echo_overflows,
+                "starved": self.echo_starved,
+                "dropped": self.echo_dropped,
+                "duplicated": self.echo_duplicated,
+                "resyncs": self.echo_resyncs,
+            },
+            "queue_depth_max": self.queue_depth_max,
+            "latency_ms": percentiles(latency_ms),
+            "latency_histogram": self.latency_histogram.to_dict(),
+        }
+
+
+def flatten(stats: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+class StatsDumper:
+    def __init__(self, snapshot: Callable[[], dict], path: str, interval: float = 10):
+        self.snapshot = snapshot
+        self.path = path
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="StatsDumper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def dump(self) -> None:
+        stats = self.snapshot()
+        if self.path.endswith(".csv"):
+            self.dump_csv(flatten(stats))
+        else:
+            # one json object per line so the file can just keep growing
+            with open(self.path, "a") as f:
+                f.write(json.dumps(stats) + "\n")
+
+    def dump_csv(self, row: dict) -> None:
+        fields: List[str] = list(row.keys())
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            if new:
+                writer.writeheader()
+            writer.writerow(row)
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+from board import AppInfo, SoundSpec
+
+
+def _create(db: sqlite3.Connection) -> None:
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    db.execute("""
+        CREATE TABLE sounds (
+            id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            volume REAL NOT NULL,
+            keys BLOB NOT NULL
+        )
+    """)
+    db.execute("CREATE INDEX sounds_position ON sounds (position)")
+
+
+def _add_scheduling(db: sqlite3.Connection) -> None:
+    db.execute("ALTER TABLE sounds ADD COLUMN loops INTEGER NOT NULL DEFAULT 1")
+    db.execute("ALTER TABLE sounds ADD COLUMN crossfade_ms INTEGER NOT NULL DEFAULT 0")
+    db.execute("ALTER TABLE sounds ADD COLUMN delay_ms INTEGER NOT NULL DEFAULT 0")
+    db.execute("ALTER TABLE sounds ADD COLUMN sequence TEXT NOT NULL DEFAULT '[]'")
+
+
+# MIGRATIONS[n] takes a database at schema version n to n + 1
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create,
+    _add_scheduling,
+]
+SCHEMA_VERSION: int = len(MIGRATIONS)
+
+SPEC_COLUMNS = ("name", "path", "volume", "loops", "crossfade_ms", "delay_ms")
+
+
+def settings_of(appinfo: AppInfo) -> dict:
+    return {key: value for key, value in vars(appinfo).items() if key not in ("sounds", "version")}
+
+
+def row_of(spec: SoundSpec, position: int) -> tuple:
+    return (spec.id, position, *(getattr(spec, column) for column in SPEC_COLUMNS), pickle.dumps(spec.keys),
+            json.dumps(spec.sequence))
+
+
+def spec_of(row: sqlite3.Row) -> SoundSpec:
+    spec = SoundSpec()
+    spec.id = row["id"]
+    for column in SPEC_COLUMNS:
+        setattr(spec, column, row[column])
+    spec.keys = pickle.loads(row["keys"])
+    spec.sequence = json.loads(row["sequence"])
+    return spec
+
+
+@contextmanager
+def transaction(db: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # connections are in autocommit mode so this covers DDL as well, which the module's own implicit transactions
+    # leave out
+    db.execute("BEGIN")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+class AppInfoStore:
+    # sqlite backed appinfo. edits only rewrite the rows that changed, batched on a writer thread
+
+    def __init__(self, path: str, legacy_path: str | None = None, debounce: float = 0.5):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.debounce = debounce
+
+        self._positions: dict[str, int] = {}
+        self._next_position: int = 0
+
+        # pending writes, swapped out wholesale by the writer
+        self._lock = threading.Lock()
+        self._dirty_specs: dict[str, tuple | None] = {}  # id -> row, None means delete
+        self._dirty_settings: dict | None = None
+        self._clear: bool = False
+        self._wake = threading.Event()
+        self._closing: bool = False
+        self._thread: threading.Thread | None = None
+
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def migrate(self, db: sqlite3.Connection) -> int:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        start = version
+        while version < SCHEMA_VERSION:
+            # a step and its version bump land together or not at all
+            with transaction(db):
+                MIGRATIONS[version](db)
+                db.execute(f"PRAGMA user_version = {version + 1}")
+            version += 1
+        return start
+
+    def load(self) -> AppInfo:
+        db = self.connect()
+        try:
+            if self.migrate(db) == 0 and self.legacy_path is not None and os.path.exists(self.legacy_path):
+                appinfo = self.import_legacy(db)
+            else:
+                appinfo = AppInfo()
+                row = db.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+                if row is not None:
+                    for key, value in json.loads(row["value"]).items():
+                        # settings that have since been removed are dropped, new ones keep their defaults
+                        if hasattr(appinfo, key):
+                            setattr(appinfo, key, value)
+
+                appinfo.sounds = []
+                for row in db.execute("SELECT * FROM sounds ORDER BY position"):
+                    spec = spec_of(row)
+                    appinfo.sounds.append(spec)
+                    self._positions[spec.id] = row["position"]
+                    self._next_position = row["position"] + 1
+        finally:
+            db.close()
+
+        self.start()
+        return appinfo
+
+    def import_legacy(self, db: sqlite3.Connection) -> AppInfo:
+        try:
+            with open(self.legacy_path, "rb") as f:
+                appinfo = AppInfo.loads(f.read())
+            if appinfo.version != AppInfo.VERSION:
+                appinfo = AppInfo()
+        except Exception:
+            traceback.print_exc()
+            appinfo = AppInfo()
+
+        with transaction(db):
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (json.dumps(settings_of(appinfo)),))
+            rows = []
+            for spec in appinfo.sounds:
+                rows.append(row_of(spec, self._next_position))
+                self._positions[spec.id] = self._next_position
+                self._next_position += 1
+            db.executemany(self.insert_sql(), rows)
+        return appinfo
+
+    @staticmethod
+    def insert_sql() -> str:
+        columns = ("id", "position", *SPEC_COLUMNS, "keys", "sequence")
+        return f"INSERT OR REPLACE INTO sounds ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    def save_settings(self, appinfo: AppInfo) -> None:
+        settings = settings_of(appinfo)
+        with self._lock:
+            self._dirty_settings = settings
+        self._wake.set()
+
+    def save_spec(self, spec: SoundSpec) -> None:
+        position = self._positions.get(spec.id)
+        if position is None:
+            position = self._positions[spec.id] = self._next_position
+            self._next_position += 1
+
+        # snapshot now, on the caller's thread, so the writer never reads a spec mid edit
+        row = row_of(spec, position)
+        with self._lock:
+            self._dirty_specs[spec.id] = row
+        self._wake.set()
+
+    def remove_spec(self, spec: SoundSpec) -> None:
+        self._positions.pop(spec.id, None)
+        with self._lock:
+            self._dirty_specs[spec.id] = None
+        self._wake.set()
+
+    def clear_specs(self) -> None:
+        self._positions = {}
+        with self._lock:
+            self._dirty_specs = {}
+            self._clear = True
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="AppInfoStore", daemon=True)
+            self._thread.start()
+
+    def run(self) -> None:
+        db = self.connect()
+        try:
+            while True:
+                self._wake.wait()
+
+                # let a burst of edits pile up so they land in one transaction, but not forever
+                deadline = time.monotonic() + self.debounce * 4
+                while not self._closing:
+                    self._wake.clear()
+                    if not self._wake.wait(self.debounce) or time.monotonic() >= deadline:
+                        break
+                self._wake.clear()
+
+                try:
+                    self.write(db)
+                except sqlite3.Error:
+                    traceback.print_exc()
+
+                if self._closing:
+                    return
+        finally:
+            db.close()
+
+    def write(self, db: sqlite3.Connection) -> None:
+        with self._lock:
+            specs, self._dirty_specs = self._dirty_specs, {}
+            settings, self._dirty_settings = self._dirty_settings, None
+            clear, self._clear = self._clear, False
+
+        if not specs and settings is None and not clear:
+            return
+
+        with transaction(db):
+            if clear:
+                db.execute("DELETE FROM sounds")
+            if settings is not None:
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (json.dumps(settings),))
+            deleted = [(spec_id,) for spec_id, row in specs.items() if row is None]
+            if deleted:
+                db.executemany("DELETE FROM sounds WHERE id = ?", deleted)
+            rows = [row for row in specs.values() if row is not None]
+            if rows:
+                db.executemany(self.insert_sql(), rows)
+
+    def close(self) -> None:
+        self._closing = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
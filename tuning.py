@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+import traceback
+
+import numpy as np
+
+from event import Event
+
+
+INTERVAL: float = 2  # seconds between looks at the stats
+GROW_LOAD: float = 0.5  # p99 mix time over the period above which the period doubles
+SHRINK_LOAD: float = 0.2  # and below which it may halve
+SHRINK_AFTER: int = 5  # clean intervals in a row before trying a smaller period
+
+
+def device_key(input_name: str, output_name: str) -> str:
+    return f"{input_name}|{output_name}"
+
+
+class ChunkTuner:
+    # finds the smallest period the machine keeps up with. any xrun, or mixing eating into the period,
+    # doubles it straight away. it only halves again after a run of clean intervals, and never back down to a
+    # size that already glitched this session
+
+    def __init__(self, devices, min_chunk: int = 128, max_chunk: int = 2048, interval: float = INTERVAL):
+        self.devices = devices
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.interval = interval
+
+        self.engine = None
+        # invoked with the new chunk once the engine is running at it, from the tuner's thread
+        self.tuned: Event[int] = Event()
+
+        self.failed: set[int] = set()
+        self._xruns: int = 0
+        self._clean: int = 0
+        self._resizing = None
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def xruns(stats) -> int:
+        return stats.input_overflows + stats.output_underruns
+
+    def start(self, engine) -> None:
+        if self._thread is not None:
+            return
+        self.engine = engine
+        self._xruns = self.xruns(engine.stats)
+        self._clean = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="ChunkTuner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.step()
+            except Exception:
+                traceback.print_exc()
+
+    def load(self) -> float:
+        times = list(self.engine.stats.chunk_times)
+        if not times:
+            return 0
+        return float(np.percentile(times, 99)) / self.engine.stats.period
+
+    def step(self) -> None:
+        stats = self.engine.stats
+        xruns = self.xruns(stats)
+
+        if self._resizing is not None:
+            if not self._resizing.done():
+                return
+            # the switch itself may have glitched, start counting afresh
+            self._resizing = None
+            self._xruns = xruns
+            return
+
+        glitched = xruns > self._xruns
+        self._xruns = xruns
+        chunk = self.engine.chunk
+        load = self.load()
+
+        if glitched or load > GROW_LOAD:
+            self._clean = 0
+            if glitched:
+                self.failed.add(chunk)
+            if chunk < self.max_chunk:
+                self.resize(min(chunk * 2, self.max_chunk))
+            return
+
+        self._clean += 1
+        smaller = chunk // 2
+        if (self._clean >= SHRINK_AFTER and load < SHRINK_LOAD and smaller >= self.min_chunk
+                and smaller not in self.failed):
+            self._clean = 0
+            self.resize(smaller)
+
+    def resize(self, chunk: int) -> None:
+        self._resizing = self.devices.resize(self.engine, chunk)
+        self._resizing.add_done_callback(lambda future: self.resized(future, chunk))
+
+    def resized(self, future, chunk: int) -> None:
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            # the device wouldn't open at that size, so don't try it again
+            self.failed.add(chunk)
+            return
+        self.tuned.invoke(self, chunk)